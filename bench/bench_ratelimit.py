@@ -0,0 +1,46 @@
+"""Flood simulation for the result-lookup limiter: CPU spent on guesses with and without it.
+
+    python bench/bench_ratelimit.py [guesses] [attacking_chats]
+"""
+import asyncio, json, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.chdir(tempfile.mkdtemp(prefix='bench_ratelimit_'))
+
+import main, storage
+
+def seed(students: int = 5000) -> None:
+    storage.init_db()
+    subs = json.dumps({s: 70.0 for s in main.SUBJECTS})
+    storage.replace_results_sync([
+        (f'{i}', f'student {i}', f'{i}', f'Student {i}', f'{9 + i % 4}A', subs, 1470.0, 70.0, len(main.SUBJECTS))
+        for i in range(students)])
+
+async def flood(guesses: int, chats: int, limited: bool) -> dict:
+    limiter = main.AttemptLimiter(rate=main.RESULTS_RATE, burst=main.RESULTS_BURST, global_rate=main.RESULTS_GLOBAL_RATE,
+                                  free_failures=main.RESULTS_FREE_FAILURES, lockout_base=30, lockout_max=3600)
+    lookups = 0
+    cpu, wall = time.process_time(), time.perf_counter()
+    for i in range(guesses):
+        chat = i % chats
+        if limited and limiter.check(chat):
+            continue
+        lookups += 1
+        res = await main.run_db(main.get_student_results, f'nobody {i}', f'x{i}')
+        if limited and not res:
+            limiter.failure(chat)
+    return {'lookups': lookups, 'cpu_s': time.process_time() - cpu, 'wall_s': time.perf_counter() - wall}
+
+async def run(guesses: int, chats: int) -> None:
+    seed()
+    await main.run_db(main.RESULTS.refresh, True)
+    off = await flood(guesses, chats, limited=False)
+    on = await flood(guesses, chats, limited=True)
+    print(f"{guesses} wrong guesses from {chats} chats")
+    for label, r in (('no limiter', off), ('limiter', on)):
+        print(f"  {label:<11} lookups={r['lookups']:>7}  cpu={r['cpu_s'] * 1e3:8.1f} ms  wall={r['wall_s'] * 1e3:8.1f} ms")
+    print(f"  CPU saved: {100 * (1 - on['cpu_s'] / off['cpu_s']):.1f}%  ({off['cpu_s'] / guesses * 1e6:.1f} us -> {on['cpu_s'] / guesses * 1e6:.1f} us per guess)")
+    main.BLOCKING.shutdown()
+
+if __name__ == '__main__':
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000, int(sys.argv[2]) if len(sys.argv) > 2 else 50))
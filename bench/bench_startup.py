@@ -0,0 +1,90 @@
+"""Time to first update: spawn the bot (run_polling against the fake Bot API from loadtest.py), deliver a
+/start as the very first getUpdates answer and time the reply. Each run is a fresh process on a DB that
+already holds the results, like a redeploy.
+
+    python bench/bench_startup.py [--students 5000] [--runs 5]
+
+`--eager` awaits the whole warm-up inside post_init first, which is how start-up used to behave.
+"""
+import argparse, json, os, statistics, subprocess, sys, tempfile, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+UID = 777
+
+def child(spawned: float, eager: bool) -> None:
+    t_start = time.time()
+    sys.path.insert(0, os.path.join(HERE, '..'))
+    import main
+    t_import = time.time()
+    import asyncio
+    from loadtest import FakeBotAPI, text_update
+
+    marks = {}
+
+    class StartupAPI(FakeBotAPI):
+        async def do_request(self, url, method, request_data=None, *args, **kwargs):
+            result = await super().do_request(url, method, request_data, *args, **kwargs)
+            if url.endswith('/sendMessage') and request_data.parameters.get('chat_id') == UID and 'reply' not in marks:
+                marks['reply'] = time.time()
+                asyncio.get_running_loop().create_task(finish())
+            return result
+
+    async def finish() -> None:
+        for step in main.WARMUP.ready:
+            await main.WARMUP.wait(step)
+        marks['ready'] = time.time()
+        app.stop_running()
+
+    api = StartupAPI(latency=0)
+    api.inbox.append(text_update(UID, '/start'))
+    app = main.build_app(request=api)
+    if eager:
+        post_init = app.post_init
+
+        async def eager_init(a) -> None:
+            await post_init(a)
+            for step in main.WARMUP.ready:
+                await main.WARMUP.wait(step)
+        app.post_init = eager_init
+    app.run_polling(close_loop=False)
+    print(json.dumps({'interpreter': t_start - spawned, 'imports': t_import - spawned,
+                      'first_reply': marks['reply'] - spawned, 'warm': marks['ready'] - spawned}))
+
+def seed(workdir: str, students: int) -> None:
+    subjects = ('Math', 'English', 'Physics', 'Chemistry', 'Biology')
+    with open(os.path.join(workdir, 'results.csv'), 'w', encoding='utf-8') as f:
+        f.write('student_id,name,' + ','.join(subjects) + '\n')
+        for i in range(students):
+            f.write(f'{9 + i % 4}{"abc"[i % 3]}{i},Student Number{i},' + ','.join(str(40 + (i * 7 + j * 13) % 60) for j in range(len(subjects))) + '\n')
+
+def spawn(workdir: str, eager: bool) -> dict:
+    env = {**os.environ, 'BOT_TOKEN': '123456:STARTUP', 'PERSISTENCE': os.getenv('PERSISTENCE', 'sqlite')}
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', repr(time.time())] + (['--eager'] if eager else [])
+    out = subprocess.run(cmd, cwd=workdir, env=env, capture_output=True, text=True, timeout=300)
+    if out.returncode:
+        sys.exit(out.stderr)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main_cli() -> None:
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--students', type=int, default=5000, help='rows in results.csv')
+    p.add_argument('--runs', type=int, default=5)
+    p.add_argument('--eager', action='store_true', help='finish the warm-up before taking updates (old behaviour)')
+    p.add_argument('--child', help=argparse.SUPPRESS)
+    args = p.parse_args()
+    if args.child:
+        return child(float(args.child), args.eager)
+
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    seed(workdir, args.students)
+    spawn(workdir, eager=True)  # first boot: migrations and the results import, not measured
+
+    print(f"{args.students} students, {args.runs} runs per mode, median seconds since spawn")
+    print(f"{'mode':<12}{'imports':>10}{'1st reply':>12}{'warm':>10}")
+    for eager in ((True, False) if args.eager else (False,)):
+        runs = [spawn(workdir, eager) for _ in range(args.runs)]
+        med = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+        print(f"{'eager' if eager else 'background':<12}{med['imports']:>10.3f}{med['first_reply']:>12.3f}{med['warm']:>10.3f}")
+
+if __name__ == '__main__':
+    main_cli()
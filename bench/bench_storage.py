@@ -0,0 +1,50 @@
+"""Per-call latency of the storage helpers: connection-per-call (old) vs pooled WAL connection (storage.py).
+
+    python bench/bench_storage.py [calls]
+"""
+import os, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def per_call(label: str, fn, n: int) -> None:
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    dt = time.perf_counter() - t0
+    print(f"{label:<42} {dt / n * 1e6:9.1f} us/call")
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    os.chdir(tempfile.mkdtemp(prefix='bench_storage_'))
+
+    # Before: what main.py did on every call
+    with sqlite3.connect('users.db') as c:
+        c.execute('CREATE TABLE IF NOT EXISTS users (chat_id INTEGER PRIMARY KEY)')
+    with sqlite3.connect('posts.db') as c:
+        c.execute('CREATE TABLE IF NOT EXISTS posts (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER, '
+                  'message_id INTEGER, text TEXT, caption TEXT, file_id TEXT)')
+        c.executemany("INSERT INTO posts (chat_id, message_id, text) VALUES (1, ?, 'post')", ((i,) for i in range(50)))
+
+    def old_save_user(i):
+        with sqlite3.connect('users.db') as conn:
+            conn.execute("INSERT OR IGNORE INTO users (chat_id) VALUES (?)", (i % 500,))
+            conn.commit()
+
+    def old_recent(i):
+        with sqlite3.connect('posts.db') as conn:
+            conn.execute("SELECT id, chat_id, message_id, text, caption, file_id FROM posts ORDER BY id DESC LIMIT ?", (5,)).fetchall()
+
+    import storage
+    storage.DB_PATH = 'bot.db'
+    storage.init_db()
+    for i in range(50):
+        storage.save_post_sync(1, i, 'post', '', None)
+
+    print(f"{n} calls each, cwd {os.getcwd()}")
+    per_call("save user           connect-per-call", old_save_user, n)
+    per_call("save_users_sync     pooled WAL", lambda i: storage.save_users_sync([i % 500]), n)
+    per_call("recent posts        connect-per-call", old_recent, n)
+    per_call("get_posts_page_sync pooled WAL", lambda i: storage.get_posts_page_sync(5), n)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""Offline load test: the real Application and build_conv() against a fake Telegram Bot API.
+
+Thousands of synthetic students go through /start -> "I have joined" -> Results (name, id) ->
+Announcements -> Back while an admin logs in and broadcasts an announcement. The fake API adds
+latency, random 429 flood errors and blocked users. Reports p50/p99 latency per step and updates/sec.
+
+    python bench/loadtest.py --students 2000 --concurrency 200 --latency 0.03
+"""
+import argparse, asyncio, itertools, json, os, random, sys, tempfile, time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.environ.setdefault('BOT_TOKEN', '123456:LOADTEST')
+os.environ.setdefault('PERSISTENCE', 'none')
+
+from telegram.request import BaseRequest
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'LoadTestBot', 'username': 'loadtest_bot'}
+
+#FAKE BOT API
+class FakeBotAPI(BaseRequest):
+    """Answers Bot API calls locally with simulated latency, flood control and blocked chats.
+    Updates appended to `inbox` are handed out by getUpdates, so run_polling works against it too;
+    `files` maps file_id -> bytes for getFile and the download that follows."""
+    def __init__(self, latency: float = 0.03, flood_rate: float = 0.0, blocked: Optional[set] = None, seed: int = 1):
+        self.latency, self.flood_rate, self.blocked = latency, flood_rate, blocked or set()
+        self.rng = random.Random(seed)
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.last_msg: Dict[int, int] = {}
+        self._ids = itertools.count(1000)
+        self.inbox: List[dict] = []
+        self.files: Dict[str, bytes] = {}
+
+    async def initialize(self) -> None: pass
+    async def shutdown(self) -> None: pass
+
+    @staticmethod
+    def _ok(result) -> tuple:
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    @staticmethod
+    def _err(code: int, description: str, **params) -> tuple:
+        body = {'ok': False, 'error_code': code, 'description': description}
+        if params:
+            body['parameters'] = params
+        return code, json.dumps(body).encode()
+
+    def _message(self, chat_id, text: str = '', mid: Optional[int] = None) -> dict:
+        mid = mid or next(self._ids)
+        try: self.last_msg[int(chat_id)] = mid
+        except (TypeError, ValueError): pass
+        chat = {'id': chat_id if isinstance(chat_id, int) else -100, 'type': 'private'}
+        return {'message_id': mid, 'date': int(time.time()), 'chat': chat, 'from': BOT_USER, 'text': text}
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None) -> tuple:
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if '/file/bot' in url:
+            return 200, self.files.get(endpoint, b'')
+        self.calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        if self.flood_rate and endpoint != 'getMe' and self.rng.random() < self.flood_rate:
+            self.errors['429'] += 1
+            return self._err(429, 'Too Many Requests: retry after 1', retry_after=1)
+        chat_id = params.get('chat_id')
+        if endpoint == 'getMe':
+            return self._ok(BOT_USER)
+        if endpoint == 'getUpdates':
+            updates, self.inbox = self.inbox, []
+            if not updates:
+                await asyncio.sleep(0.05)  # a short "long poll"
+            return self._ok(updates)
+        if chat_id in self.blocked and endpoint.startswith('send'):
+            self.errors['403'] += 1
+            return self._err(403, 'Forbidden: bot was blocked by the user')
+        if endpoint in ('sendMessage', 'sendPhoto'):
+            return self._ok(self._message(chat_id, params.get('text', '')))
+        if endpoint in ('editMessageText', 'editMessageReplyMarkup'):
+            return self._ok(self._message(chat_id, params.get('text', ''), params.get('message_id')))
+        if endpoint == 'getFile':
+            file_id = params.get('file_id')
+            return self._ok({'file_id': file_id, 'file_unique_id': file_id, 'file_path': file_id,
+                             'file_size': len(self.files.get(file_id, b''))})
+        if endpoint == 'getChatMember':
+            return self._ok({'status': 'member', 'user': {'id': params.get('user_id'), 'is_bot': False, 'first_name': 'S'}})
+        return self._ok(True)  # deleteMessage, answerCallbackQuery, setWebhook, ...
+
+#SYNTHETIC UPDATES
+_update_ids = itertools.count(1)
+
+def _user(uid: int) -> dict:
+    return {'id': uid, 'is_bot': False, 'first_name': f'Student{uid}'}
+
+def text_update(uid: int, text: str) -> dict:
+    msg = {'message_id': next(_update_ids) + 10**8, 'date': int(time.time()), 'chat': {'id': uid, 'type': 'private'},
+           'from': _user(uid), 'text': text}
+    if text.startswith('/'):
+        msg['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': next(_update_ids), 'message': msg}
+
+def document_update(uid: int, file_name: str, file_id: str) -> dict:
+    data = text_update(uid, '')
+    del data['message']['text']
+    data['message']['document'] = {'file_id': file_id, 'file_unique_id': file_id, 'file_name': file_name}
+    return data
+
+def callback_update(uid: int, data: str, api: FakeBotAPI) -> dict:
+    menu = {'message_id': api.last_msg.get(uid, 1), 'date': int(time.time()), 'chat': {'id': uid, 'type': 'private'},
+            'from': BOT_USER, 'text': 'menu'}
+    return {'update_id': next(_update_ids), 'callback_query': {'id': str(next(_update_ids)), 'from': _user(uid),
+                                                               'chat_instance': str(uid), 'data': data, 'message': menu}}
+
+#RUN
+def seed_results(main, students: int) -> List[tuple]:
+    """Write a synthetic results sheet and import it through the real pipeline; returns (name, id) pairs"""
+    people = [(f'Student Number{i}', f'{9 + i % 4}{"abc"[i % 3]}{i}') for i in range(students)]
+    with open(main.RESULTS_FILE, 'w', encoding='utf-8') as f:
+        f.write('student_id,name,' + ','.join(main.SUBJECTS) + '\n')
+        for name, sid in people:
+            f.write(f'{sid},{name},' + ','.join(str(50 + (hash((sid, s)) % 50)) for s in main.SUBJECTS) + '\n')
+    main.import_results_file()
+    return people
+
+async def replay(args) -> None:
+    import main
+    from telegram import Update
+
+    main.init_db()
+    people = seed_results(main, args.students)
+    main.RESULTS.refresh(force=True)
+    main.BROADCAST_BUCKET = main.TokenBucket(args.broadcast_rate)
+
+    first_uid = 10**6
+    blocked = {first_uid + i for i in range(0, args.students, max(1, int(1 / args.blocked))) } if args.blocked else set()
+    api = FakeBotAPI(args.latency, args.flood_rate, blocked)
+    app = main.build_app(request=api)
+    await app.initialize()
+    await app.post_init(app)
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    done = 0
+
+    async def send(step: str, data: dict) -> None:
+        nonlocal done
+        t0 = time.perf_counter()
+        await app.process_update(Update.de_json(data, app.bot))
+        latencies[step].append(time.perf_counter() - t0)
+        done += 1
+
+    async def student(i: int, sem: asyncio.Semaphore) -> None:
+        uid = first_uid + i
+        name, sid = people[i]
+        if random.random() < args.wrong_ratio:
+            sid = 'wrong' + sid
+        async with sem:
+            await send('start', text_update(uid, '/start'))
+            await send('check_join', callback_update(uid, 'check_join', api))
+            await send('results', callback_update(uid, 'results', api))
+            await send('results_name', text_update(uid, name))
+            await send('results_id', text_update(uid, sid))
+            await send('announcements', callback_update(uid, 'announcements', api))
+            await send('back', callback_update(uid, 'back', api))
+
+    async def admin() -> None:
+        uid = 42
+        await send('admin', text_update(uid, '/admin'))
+        await send('admin_login', text_update(uid, main.ADMIN_PASS))
+        await send('admin_menu', callback_update(uid, 'post', api))
+        await asyncio.sleep(1)  # let most students /start so the broadcast has an audience
+        await send('admin_post', text_update(uid, 'Exam results are out!'))
+
+    sem = asyncio.Semaphore(args.concurrency)
+    t0 = time.perf_counter()
+    await asyncio.gather(admin(), *(student(i, sem) for i in range(args.students)))
+    elapsed = time.perf_counter() - t0
+
+    b0 = time.perf_counter()
+    while await main.run_db(main.get_running_broadcasts_sync):
+        await asyncio.sleep(0.1)
+    broadcast_s = time.perf_counter() - b0
+
+    print(f"\n{args.students} students, concurrency {args.concurrency}, API latency {args.latency * 1e3:.0f} ms, "
+          f"429 rate {args.flood_rate:.2%}, blocked {len(blocked)}")
+    print(f"{done} updates in {elapsed:.2f} s -> {done / elapsed:.0f} updates/s")
+    print(f"{'step':<15}{'n':>7}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, xs in latencies.items():
+        xs.sort()
+        pick = lambda q: xs[min(len(xs) - 1, int(q * len(xs)))] * 1e3
+        print(f"{step:<15}{len(xs):>7}{pick(0.5):>10.1f}{pick(0.99):>10.1f}{xs[-1] * 1e3:>10.1f}")
+    counts = {}
+    for job_id in [r[0] for r in main.storage.conn().execute("SELECT id FROM broadcasts")]:
+        counts = await main.run_db(main.broadcast_counts_sync, job_id)
+    print(f"broadcast drained {broadcast_s:.2f} s after the students finished: {counts}")
+    print("Bot API calls:", dict(api.calls.most_common()), "errors:", dict(api.errors))
+    if args.metrics:
+        print(main.METRICS.render())
+
+    await app.shutdown()
+    await app.post_shutdown(app)
+
+def main_cli() -> None:
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--students', type=int, default=1000)
+    p.add_argument('--concurrency', type=int, default=100, help='students active at once')
+    p.add_argument('--latency', type=float, default=0.03, help='mean fake Bot API latency (s)')
+    p.add_argument('--flood-rate', type=float, default=0.0, help='share of calls answered with 429')
+    p.add_argument('--blocked', type=float, default=0.02, help='share of students who blocked the bot')
+    p.add_argument('--wrong-ratio', type=float, default=0.1, help='share of lookups with a wrong id')
+    p.add_argument('--metrics', action='store_true', help='dump the /metrics exposition at the end')
+    p.add_argument('--broadcast-rate', type=float, default=1000, help='broadcast msgs/s (real bot: 25)')
+    args = p.parse_args()
+    os.chdir(tempfile.mkdtemp(prefix='loadtest_'))
+    asyncio.run(replay(args))
+
+if __name__ == '__main__':
+    main_cli()
@@ -1,11 +1,28 @@
-import logging, os, csv, sqlite3, asyncio
+import logging, os, csv, json, asyncio, threading, time, heapq, hmac, hashlib, itertools, tempfile, html, re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Any, Optional, List
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
+from telegram import Update, Message, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, ConversationHandler, 
     MessageHandler, filters, ContextTypes
 )
 from telegram.helpers import escape_markdown
+from telegram.request import HTTPXRequest
+from telegram.error import RetryAfter, Forbidden, BadRequest, TimedOut, NetworkError
+
+import metrics
+import storage
+from persistence import make_persistence
+from storage import (
+    init_db, save_users_sync, get_all_users_sync, remove_users_sync,
+    save_post_sync, get_posts_page_sync, delete_post_by_id_sync, update_post_text_sync,
+    create_broadcast_sync, get_broadcast_sync, get_running_broadcasts_sync, claim_deliveries_sync,
+    mark_deliveries_sync, broadcast_counts_sync, finish_broadcast_sync,
+    add_pending_deletes_sync, forget_pending_deletes_sync, pop_due_deletes_sync,
+    get_meta_sync, set_meta_sync, results_version_sync, load_results_sync,
+    create_ticket_sync, due_tickets_sync, mark_tickets_sync, get_tickets_page_sync, resolve_ticket_sync, ticket_counts_sync,
+)
 
 #CONFIG 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "...")
@@ -13,6 +30,55 @@ ADMIN_PASS = "..."
 CHANNEL_ID = "..."
 SUPPORT_ID = "..."
 RECENT_COUNT = ...
+RESULTS_FILE = 'results.csv'
+RESULTS_RECHECK = 2.0  # seconds between results_version checks
+IMPORT_TIMEOUT = 300   # seconds allowed for one bulk results import
+RESULTS_RATE = 0.2           # result lookups per second per chat (refill)...
+RESULTS_BURST = 5            # ...with this many back to back
+RESULTS_GLOBAL_RATE = 200    # lookups per second across all chats
+RESULTS_FREE_FAILURES = 5    # misses before exponential lockout starts (30 s, 60 s, ... 1 h)
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "4"))
+BLOCKING_TIMEOUT = float(os.getenv("BLOCKING_TIMEOUT", "10"))
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "") == "1"  # log any callback that blocks the event loop
+LOOP_SLOW_CALLBACK = 0.05
+BROADCAST_RATE = 25            # msgs/sec, under Telegram's ~30/sec bot-wide limit
+BROADCAST_CONCURRENCY = 20     # in-flight sendMessage calls
+BROADCAST_RETRIES = 5
+BROADCAST_BATCH = 200          # deliveries claimed (and results saved) per SQLite round trip
+BROADCAST_PROGRESS_EVERY = 3.0 # seconds between status edits (stays under the per-chat edit limit)
+MEMBER_TTL = float(os.getenv("MEMBER_TTL", "600"))                   # seconds a confirmed member is trusted
+MEMBER_NEGATIVE_TTL = float(os.getenv("MEMBER_NEGATIVE_TTL", "30"))  # seconds a "not joined" answer is reused
+MEMBER_CACHE_SIZE = 20000
+ANNOUNCEMENT_COUNT = 5         # posts per page of the announcements archive
+USER_FLUSH_MS = 500            # write-behind interval for new subscribers
+USER_FLUSH_MAX = 200           # ...or flush as soon as this many are buffered
+DELETE_CONCURRENCY = 10        # deleteMessage calls in flight per cleanup
+MAX_TRACKED = 30               # tracked message ids kept per user per list; older ones are deleted at once
+RESULT_TTL = 60                # seconds a results message stays in the chat
+TRACK_TTL = 24 * 3600          # other tracked messages are swept after this even if the session is lost
+SWEEP_EVERY = 60               # seconds between sweeps of overdue pending deletes
+SWEEP_BATCH = 500
+SUPPORT_DIGEST = float(os.getenv("SUPPORT_DIGEST", "0"))  # seconds to gather tickets into one digest; 0 = one message each
+SUPPORT_RETRIES = 8            # delivery attempts before a ticket is marked undelivered (admins still see it)
+SUPPORT_BACKOFF = 5            # seconds before the first retry, doubling up to SUPPORT_BACKOFF_MAX
+SUPPORT_BACKOFF_MAX = 900
+SUPPORT_POLL = 5               # seconds between checks for due retries and other workers' tickets
+SUPPORT_BATCH = 50             # tickets per dispatch round
+STOP_GRACE = 5.0               # seconds a background loop gets to finish its round at shutdown before it is cancelled
+TICKET_PAGE = 5                # open tickets per page in the admin list
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public https base URL; empty = long polling
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "64"))  # updates processed at once (per-chat order kept)
+WEBHOOK_MAX_QUEUED = 10000
+WORKERS = int(os.getenv("WORKERS", "1"))           # >1: shard chats across processes (webhook mode only)
+PERSISTENCE = os.getenv("PERSISTENCE", "sqlite")   # conversation state + user_data: sqlite | redis | none
+PERSIST_INTERVAL = 5                               # seconds between persistence flushes
+SHARED_CACHE_TTL = 5                               # announcements cache expiry when several workers share the DB
+WORKER_INDEX: Optional[int] = None                 # set by build_app in sharded workers
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # >0: serve /metrics here (+ worker index when sharded); 0 = off
 
 #SUBJECTS 
 SUBJECTS = (
@@ -24,7 +90,7 @@ SUBJECTS = (
 
 #STATES
 (STUDENT_MENU, RESULTS_NAME, RESULTS_ID, SUPPORT_ISSUE, SUPPORT_NAME, 
- ADMIN_LOGIN, ADMIN_MENU, ADMIN_POST, ADMIN_EDIT, ADMIN_DELETE) = range(10)
+ ADMIN_LOGIN, ADMIN_MENU, ADMIN_POST, ADMIN_EDIT, ADMIN_DELETE, ADMIN_IMPORT, ANNOUNCE_SEARCH) = range(12)
 
 #PLACEHOLDERS
 SCHOOL_INFO = (
@@ -41,57 +107,148 @@ BOT_INFO = (
     "official announcements and result checking for students and parents."
 )
 
+#METRICS
+METRICS = metrics.Registry()
+METRICS_SERVER = metrics.MetricsServer(METRICS)
+
 #ASYNC DB HELPERS
-async def run_db(func, *args):
-    return await asyncio.to_thread(func, *args)
-
-#DATABASES
-def init_dbs():
-    for db, ddl in (
-        ('users.db', 'CREATE TABLE IF NOT EXISTS users (chat_id INTEGER PRIMARY KEY)'),
-        ('posts.db', '''CREATE TABLE IF NOT EXISTS posts 
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER, 
-                         message_id INTEGER, text TEXT, caption TEXT, file_id TEXT)'''),
-    ):
-        conn = sqlite3.connect(db)
-        conn.execute(ddl)
-        conn.commit()
-        conn.close()
-
-def save_user_sync(chat_id: int):
-    with sqlite3.connect('users.db') as conn:
-        conn.execute("INSERT OR IGNORE INTO users (chat_id) VALUES (?)", (chat_id,))
-        conn.commit()
-
-def save_post_sync(chat_id: int, message_id: int, text: str, caption: str, file_id: str):
-    with sqlite3.connect('posts.db') as conn:
-        conn.execute(
-            "INSERT INTO posts (chat_id, message_id, text, caption, file_id) VALUES (?, ?, ?, ?, ?)",
-            (chat_id, message_id, text, caption, file_id))
-        conn.commit()
-
-def get_recent_posts_full_sync(limit: int = RECENT_COUNT) -> List[dict]:
-    with sqlite3.connect('posts.db') as conn:
-        rows = conn.execute(
-            "SELECT id, chat_id, message_id, text, caption, file_id FROM posts ORDER BY id DESC LIMIT ?", 
-            (limit,)
-        ).fetchall()
-        return [{'id': r[0], 'chat_id': r[1], 'message_id': r[2], 'text': r[3], 
-                 'caption': r[4], 'file_id': r[5]} for r in rows]
-
-def delete_post_by_id_sync(post_id: int):
-    with sqlite3.connect('posts.db') as conn:
-        conn.execute("DELETE FROM posts WHERE id = ?", (post_id,))
-        conn.commit()
-
-def get_all_users_sync() -> List[int]:
-    with sqlite3.connect('users.db') as conn:
-        return [row[0] for row in conn.execute("SELECT chat_id FROM users")]
-
-def remove_user_sync(chat_id: int):
-    with sqlite3.connect('users.db') as conn:
-        conn.execute("DELETE FROM users WHERE chat_id = ?", (chat_id,))
-        conn.commit()
+class BlockingExecutor:
+    """Dedicated, bounded thread pool for every blocking call (SQLite, files) made from handlers"""
+    def __init__(self, workers: int = BLOCKING_WORKERS, timeout: float = BLOCKING_TIMEOUT):
+        self.workers, self.timeout = workers, timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='blocking')
+        # Counters are only touched on the loop thread (wait_* from workers is advisory)
+        self.pending = self.peak = self.calls = self.timeouts = self.errors = 0
+        self.wait_total = self.wait_max = 0.0
+
+    @staticmethod
+    def _timed(marks: list, func, args):
+        marks.append(time.monotonic())
+        try:
+            return func(*args)
+        finally:
+            marks.append(time.monotonic())
+
+    async def run(self, func, *args, timeout: Optional[float] = None):
+        loop = asyncio.get_running_loop()
+        self.calls += 1
+        self.pending += 1
+        if self.pending > self.peak: self.peak = self.pending
+        marks: list = []  # start/end stamps from the worker thread, read back here on the loop thread
+        submitted = time.monotonic()
+        try:
+            fut = loop.run_in_executor(self._pool, self._timed, marks, func, args)
+            async with asyncio.timeout(timeout or self.timeout):
+                return await fut
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logging.error("blocking call %s timed out after %ss", getattr(func, '__name__', func), timeout or self.timeout)
+            raise
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.pending -= 1
+            if len(marks) == 2:
+                wait = marks[0] - submitted
+                self.wait_total += wait
+                if wait > self.wait_max: self.wait_max = wait
+                METRICS.observe('executor_wait_seconds', (), wait)
+                METRICS.observe('db_seconds', (('func', getattr(func, '__name__', 'call')),), marks[1] - marks[0])
+
+    def stats(self) -> Dict[str, Any]:
+        return {'workers': self.workers, 'pending': self.pending, 'queued': max(0, self.pending - self.workers),
+                'peak': self.peak, 'calls': self.calls, 'timeouts': self.timeouts, 'errors': self.errors,
+                'wait_avg': self.wait_total / self.calls if self.calls else 0.0, 'wait_max': self.wait_max}
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+BLOCKING = BlockingExecutor()
+METRICS.gauges('executor', BLOCKING.stats)
+
+async def run_db(func, *args, timeout: Optional[float] = None):
+    # Nothing touches SQLite before the warm-up has checked the schema
+    if not WARMUP.db_ready.is_set():
+        await WARMUP.wait('db')
+    return await BLOCKING.run(func, *args, timeout=timeout)
+
+#BACKGROUND LOOPS
+# Each loop checks its own stop event rather than relying on cancel(): on Python 3.11 asyncio.wait_for
+# can swallow a cancel that lands as its wait completes, and a loop around it would then never end.
+async def wait_set(event: asyncio.Event, timeout: Optional[float]) -> bool:
+    """Wait up to `timeout` seconds for `event`; True if it was set"""
+    try:
+        async with asyncio.timeout(timeout):
+            await event.wait()
+        return True
+    except TimeoutError:
+        return False
+
+async def stop_loop(task: asyncio.Task, *events: asyncio.Event) -> None:
+    """Set the loop's stop (and wake) events and let it finish its round; cancel it after STOP_GRACE"""
+    for e in events:
+        e.set()
+    done, _ = await asyncio.wait({task}, timeout=STOP_GRACE)
+    if not done:
+        logging.warning("%s still busy after %ss, cancelling it", task.get_name(), STOP_GRACE)
+        task.cancel()
+        await asyncio.wait({task})
+    if not task.cancelled() and task.exception():
+        logging.error("%s failed", task.get_name(), exc_info=task.exception())
+
+#KNOWN USERS
+class KnownUsers:
+    """Subscribed chat_ids held in memory; new ones are written behind in batched transactions"""
+    def __init__(self, flush_ms: int = USER_FLUSH_MS, flush_max: int = USER_FLUSH_MAX):
+        self.flush_every, self.flush_max = flush_ms / 1000, flush_max
+        self.ids: set = set()
+        self.buffer: List[int] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self, chat_ids: List[int]) -> None:
+        self.ids.update(chat_ids)
+
+    def add(self, chat_id: int) -> None:
+        if chat_id in self.ids:
+            return
+        self.ids.add(chat_id)
+        self.buffer.append(chat_id)
+        if len(self.buffer) >= self.flush_max and self._wake:
+            self._wake.set()
+
+    def discard(self, chat_ids: List[int]) -> None:
+        self.ids.difference_update(chat_ids)
+
+    async def flush(self) -> None:
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        try:
+            await run_db(save_users_sync, batch)
+        except Exception:
+            # Keep them for the next round rather than losing subscribers
+            self.buffer[:0] = batch
+            logging.exception("flushing %d new users failed", len(batch))
+
+    async def _run(self) -> None:
+        while not self._stop.is_set():
+            await wait_set(self._wake, self.flush_every)
+            self._wake.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        self._wake, self._stop = asyncio.Event(), asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name='known users')
+
+    async def stop(self) -> None:
+        if self._task:
+            await stop_loop(self._task, self._stop, self._wake)
+        await self.flush()
+
+KNOWN_USERS = KnownUsers()
 
 #Main menu
 def student_main_kb() -> InlineKeyboardMarkup:
@@ -111,6 +268,9 @@ def admin_kb() -> InlineKeyboardMarkup:
         [InlineKeyboardButton("✍️ Post", callback_data='post')],
         [InlineKeyboardButton("📝 Edit Post", callback_data='edit_post')],
         [InlineKeyboardButton("🗑️ Delete Post", callback_data='delete_post')],
+        [InlineKeyboardButton("📥 Import Results", callback_data='import_results')],
+        [InlineKeyboardButton("📈 Statistics", callback_data='stats')],
+        [InlineKeyboardButton("🎫 Support Tickets", callback_data='tickets')],
         [InlineKeyboardButton("🔒 Logout", callback_data='logout')]
     ])
 
@@ -124,45 +284,223 @@ def join_channel_kb() -> InlineKeyboardMarkup:
     ]])
 
 #CLEANUP
-def track_result(context: ContextTypes.DEFAULT_TYPE, msg_id: int, chat_id: int) -> None:
-    context.user_data.setdefault('result_msgs', []).append((msg_id, chat_id))
+# Deletions never sit in front of the next screen: tracked ids are popped synchronously and the
+# delete calls run in the background, DELETE_CONCURRENCY at a time. Every tracked message is also
+# recorded in pending_deletes with a deadline, so it still gets deleted if the bot restarts.
+class PendingDeletes:
+    """Write-behind log of tracked messages, plus the sweeper that deletes overdue ones"""
+    def __init__(self, flush_ms: int = USER_FLUSH_MS):
+        self.flush_every = flush_ms / 1000
+        self.added: Dict[tuple, float] = {}
+        self.forgotten: set = set()
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
 
-async def delete_results(context: ContextTypes.DEFAULT_TYPE) -> None:
-    for msg_id, chat_id in context.user_data.get('result_msgs', []):
-        await safe_delete(chat_id, msg_id, context.bot)
-    context.user_data.pop('result_msgs', None)
+    def add(self, chat_id: int, msg_id: int, ttl: float) -> None:
+        self.forgotten.discard((chat_id, msg_id))
+        self.added[(chat_id, msg_id)] = time.time() + ttl
+
+    def forget(self, targets: List[tuple]) -> None:
+        for t in targets:
+            # Added and deleted within one flush window: never needs to reach the DB
+            if self.added.pop(t, None) is None:
+                self.forgotten.add(t)
+
+    async def flush(self) -> None:
+        added, self.added = self.added, {}
+        forgotten, self.forgotten = self.forgotten, set()
+        try:
+            if added:
+                await run_db(add_pending_deletes_sync, [(c, m, d) for (c, m), d in added.items()])
+            if forgotten:
+                await run_db(forget_pending_deletes_sync, list(forgotten))
+        except Exception:
+            logging.exception("flushing pending deletes failed")
+
+    async def sweep(self, bot) -> int:
+        """Delete everything past its deadline, SWEEP_BATCH rows per round trip"""
+        await self.flush()
+        swept = 0
+        while due := await run_db(pop_due_deletes_sync, time.time(), SWEEP_BATCH):
+            await delete_many(bot, due)
+            swept += len(due)
+            if len(due) < SWEEP_BATCH:
+                break
+        if swept:
+            logging.info("Swept %d overdue messages", swept)
+        return swept
+
+    async def _run(self, bot) -> None:
+        last_sweep = time.monotonic()
+        await self.sweep(bot)
+        while not await wait_set(self._stop, self.flush_every):
+            await self.flush()
+            if time.monotonic() - last_sweep >= SWEEP_EVERY:
+                last_sweep = time.monotonic()
+                await self.sweep(bot)
+
+    def start(self, bot) -> None:
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run(bot), name='pending deletes')
+
+    async def stop(self) -> None:
+        if self._task:
+            await stop_loop(self._task, self._stop)
+        await self.flush()
+
+PENDING_DELETES = PendingDeletes()
+
+class ExpiryScheduler:
+    """Single timer for all result self-destructs: a heap of deadlines drained by one task.
+    Rescheduling a key supersedes its earlier deadline, which is then skipped when popped."""
+    def __init__(self, on_expire):
+        self.on_expire = on_expire
+        self._heap: List[tuple] = []
+        self._due: Dict[Any, float] = {}
+        self._wake: Optional[asyncio.Event] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, key, delay: float) -> None:
+        deadline = time.monotonic() + delay
+        self._due[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+        if len(self._heap) > 2 * len(self._due) + 64:
+            # Drop superseded entries so the heap tracks live keys, not total lookups
+            self._heap = [(d, k) for d, k in self._heap if self._due.get(k) == d]
+            heapq.heapify(self._heap)
+        if self._wake and self._heap[0][0] == deadline:
+            self._wake.set()
+
+    async def _run(self, app: Application) -> None:
+        while not self._stop.is_set():
+            await wait_set(self._wake, self._heap[0][0] - time.monotonic() if self._heap else None)
+            self._wake.clear()
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, key = heapq.heappop(self._heap)
+                if self._due.get(key) != deadline:
+                    continue
+                del self._due[key]
+                try: self.on_expire(app, key)
+                except Exception: logging.exception("expiry callback for %s failed", key)
+
+    def start(self, app: Application) -> None:
+        self._wake, self._stop = asyncio.Event(), asyncio.Event()
+        self._task = asyncio.create_task(self._run(app), name='result expiry')
+
+    async def stop(self) -> None:
+        if self._task:
+            await stop_loop(self._task, self._stop, self._wake)
+
+def expire_results(app: Application, user_id: int) -> None:
+    user_data = app.user_data.get(user_id)
+    targets = [(c, m) for m, c in user_data.pop('result_msgs', [])] if user_data else []
+    if targets:
+        PENDING_DELETES.forget(targets)
+        app.create_task(delete_many(app.bot, targets))
+
+RESULT_EXPIRY = ExpiryScheduler(expire_results)
+
+def _track(context: ContextTypes.DEFAULT_TYPE, key: str, item, chat_id: int, msg_id: int, ttl: float) -> None:
+    tracked = context.user_data.setdefault(key, [])
+    tracked.append(item)
+    PENDING_DELETES.add(chat_id, msg_id, ttl)
+    if len(tracked) > MAX_TRACKED:
+        overflow = tracked[:-MAX_TRACKED]
+        del tracked[:-MAX_TRACKED]
+        defer_delete(context, [(chat_id, i if key == 'to_clean' else i[0]) for i in overflow])
+
+def track_result(context: ContextTypes.DEFAULT_TYPE, msg_id: int, chat_id: int) -> None:
+    _track(context, 'result_msgs', (msg_id, chat_id), chat_id, msg_id, RESULT_TTL)
 
 def track_message(context: ContextTypes.DEFAULT_TYPE, msg_id: int, chat_id: int) -> None:
-    context.user_data.setdefault('all_messages', []).append((msg_id, chat_id))
+    _track(context, 'all_messages', (msg_id, chat_id), chat_id, msg_id, TRACK_TTL)
+
+def track_admin(context: ContextTypes.DEFAULT_TYPE, msg_id: int, chat_id: int) -> None:
+    _track(context, 'to_clean', msg_id, chat_id, msg_id, TRACK_TTL)
+
+async def delete_many(bot, targets) -> None:
+    """Delete (chat_id, msg_id) pairs concurrently with a bounded number of calls in flight"""
+    sem = asyncio.Semaphore(DELETE_CONCURRENCY)
+    async def one(chat_id: int, msg_id: int) -> None:
+        async with sem:
+            await safe_delete(chat_id, msg_id, bot)
+    await asyncio.gather(*(one(c, m) for c, m in dict.fromkeys(targets)))
+
+def defer_delete(context: ContextTypes.DEFAULT_TYPE, targets: List[tuple]) -> None:
+    if targets:
+        PENDING_DELETES.forget(targets)
+        context.application.create_task(delete_many(context.bot, targets))
+
+def pop_results(context: ContextTypes.DEFAULT_TYPE) -> List[tuple]:
+    return [(c, m) for m, c in context.user_data.pop('result_msgs', [])]
+
+def pop_messages(context: ContextTypes.DEFAULT_TYPE) -> List[tuple]:
+    return [(c, m) for m, c in context.user_data.pop('all_messages', [])]
+
+def pop_admin_trail(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> List[tuple]:
+    trail = [(chat_id, m) for m in context.user_data.get('to_clean', [])]
+    context.user_data['to_clean'] = []
+    return trail
+
+async def delete_results(context: ContextTypes.DEFAULT_TYPE) -> None:
+    defer_delete(context, pop_results(context))
 
 async def cleanup_all_messages(context: ContextTypes.DEFAULT_TYPE) -> None:
-    for msg_id, chat_id in context.user_data.get('all_messages', []):
-        await safe_delete(chat_id, msg_id, context.bot)
-    context.user_data.pop('all_messages', None)
+    defer_delete(context, pop_messages(context))
 
 async def wipe_admin_trail(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
-    for mid in context.user_data.get('to_clean', []):
-        await safe_delete(chat_id, mid, context.bot)
-    context.user_data['to_clean'] = []
+    defer_delete(context, pop_admin_trail(context, chat_id))
 
-async def wipe_everything(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> None:
-    """Master cleanup: wipes student msgs, results, AND admin trail"""
-    await cleanup_all_messages(context)
-    await delete_results(context)
-    await wipe_admin_trail(context, chat_id)
+async def wipe_everything(context: ContextTypes.DEFAULT_TYPE, chat_id: int, keep: Optional[tuple] = None) -> None:
+    """Master cleanup: wipes student msgs, results, AND admin trail.
+    `keep` spares one tracked screen (the menu being pressed) so clean_and_send can edit it in place."""
+    messages = pop_messages(context)
+    if keep in messages:
+        messages.remove(keep)
+        context.user_data['all_messages'] = [(keep[1], keep[0])]
+    defer_delete(context, messages + pop_results(context) + pop_admin_trail(context, chat_id))
+
+def menu_of(update: Update) -> Optional[tuple]:
+    q = update.callback_query
+    return (q.message.chat.id, q.message.message_id) if q and q.message else None
+
+async def edit_in_place(update: Update, text: str, markup) -> Optional[Message]:
+    """Turn the pressed menu into the next screen: one editMessageText instead of sendMessage + deleteMessage.
+    None when it cannot be edited (photo, inaccessible/too old, reply keyboard, gone) and a new message is needed."""
+    q = update.callback_query
+    if not isinstance(q.message, Message) or q.message.text is None:
+        return None
+    if markup is not None and not isinstance(markup, InlineKeyboardMarkup):
+        return None
+    try:
+        edited = await q.edit_message_text(text, parse_mode='Markdown', reply_markup=markup)
+    except BadRequest as e:
+        if 'not modified' in str(e).lower():
+            return q.message  # same screen pressed twice
+        return None
+    return edited if isinstance(edited, Message) else q.message
 
 async def clean_and_send(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, markup) -> None:
-    await cleanup_all_messages(context)
+    stale = pop_messages(context)
     if update.callback_query:
         await update.callback_query.answer()
-        try:
-             await update.callback_query.message.delete()
-        except: pass
-        msg = await context.bot.send_message(update.effective_chat.id, text, parse_mode='Markdown', reply_markup=markup)
+        menu = menu_of(update)
+        # Only our own tracked screens are edited; results and admin-trail messages have their own cleanup
+        msg = await edit_in_place(update, text, markup) if menu in stale else None
+        if msg is not None:
+            stale.remove(menu)
+        else:
+            # New screen first, then the old menu goes away with the rest of the stale messages
+            msg = await context.bot.send_message(update.effective_chat.id, text, parse_mode='Markdown', reply_markup=markup)
+            if menu:
+                stale.append(menu)
     else:
         msg = await update.message.reply_text(text, parse_mode='Markdown', reply_markup=markup)
     
     track_message(context, msg.message_id, msg.chat_id)
+    defer_delete(context, stale)
 
 #STRAY-TEXT HANDLER
 async def please_use_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -172,26 +510,73 @@ async def please_use_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return STUDENT_MENU
 
 #HELPERS
+class ResultsIndex:
+    """In-memory copy of the results table keyed by normalized (student_id, name); reloaded when an import bumps
+    results_version, which includes results.csv being edited on disk (re-imported on the next check)"""
+    def __init__(self, recheck: float = RESULTS_RECHECK):
+        self.recheck = recheck
+        self._table: Dict[tuple, Dict[str, Any]] = {}
+        self.stats: Dict[str, Any] = {'subjects': {}, 'classes': {}}
+        self._version: Optional[int] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _build() -> Dict[tuple, Dict[str, Any]]:
+        # Aggregates were computed at import time; scores are decoded once here, never per lookup
+        return {(id_key, name_key): {'subs': json.loads(scores), 'total': total, 'avg': avg, 'count': count, 'class': cls}
+                for id_key, name_key, _, _, cls, scores, total, avg, count in load_results_sync()}
+
+    def refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked < self.recheck:
+            return
+        with self._lock:
+            self._checked = now
+            import_results_file()  # one stat() unless results.csv was modified since it was last seen
+            version = results_version_sync()
+            if version == self._version and not force:
+                return
+            table = self._build()
+            # Ranks, percentiles and subject averages are computed once per results version and
+            # folded into the entries, so showing them costs nothing per lookup
+            import stats  # NumPy: loaded here, on the warm-up thread, rather than at start-up
+            computed = stats.compute(table, SUBJECTS)
+            for k, extra in computed.pop('students').items():
+                table[k].update(extra)
+            # Single reference swap: readers see either the old table or the new one, never a partial build
+            self._table, self.stats, self._version = table, computed, version
+            logging.info("Loaded %d results (version %s)", len(table), version)
+
+    def lookup(self, name: str, st_id: str) -> Optional[Dict[str, Any]]:
+        import results_import
+        self.refresh()
+        return self._table.get(results_import.key(st_id, name))
+
+RESULTS = ResultsIndex()
+
 def get_student_results(name: str, st_id: str) -> Optional[Dict[str, Any]]:
-    try:
-        with open('results.csv', encoding='utf-8') as f:
-            for row in csv.DictReader(f):
-                if row['name'].strip().lower() == name.strip().lower() and row['student_id'].strip().lower() == st_id.strip().lower():
-                    subs, scores = {}, []
-                    for s in SUBJECTS:
-                        val = row.get(s, '').strip()
-                        if val:
-                            try:
-                                score = float(val.replace('%', ''))
-                                subs[s] = score
-                                scores.append(score)
-                            except ValueError: pass
-                    total = round(sum(scores), 2) if scores else 0
-                    avg = round(total / len(scores), 2) if scores else 0
-                    return {'subs': subs, 'total': total, 'avg': avg, 'count': len(scores)}
-    except FileNotFoundError:
-        logging.error("results.csv missing")
-    return None
+    return RESULTS.lookup(name, st_id)
+
+def render_results(name: str, res: Dict[str, Any]) -> str:
+    class_subjects = RESULTS.stats['classes'].get(res['class'], {}).get('subjects', {})
+    def line(s: str, score: float) -> str:
+        avg = class_subjects.get(s, {}).get('mean')
+        return f"• {s}: *{score}*" + (f" (class avg {avg})" if avg is not None else "")
+    txt = f"📊 *Results for {name}*\n\n" + "\n".join(line(s, score) for s, score in res['subs'].items()) + f"\n\n📈 Total: {res['total']} 📊 Average: {res['avg']}%"
+    if res.get('class') and res.get('class_rank'):
+        txt += f"\n🏅 Class {res['class']}: rank {res['class_rank']}/{res['class_size']} · percentile {res['percentile']:.0f}"
+    return txt
+
+def render_stats() -> str:
+    st = RESULTS.stats
+    if not st['subjects']:
+        return "📈 No results loaded yet."
+    lines = ["📈 *Subject statistics (whole school)*\n"]
+    lines += [f"• {s}: mean *{v['mean']}*, median {v['median']} (n={v['n']})" for s, v in st['subjects'].items()]
+    lines.append("\n🏫 *Classes*")
+    lines += [f"• {c or '?'}: {v['size']} students, mean total {v['mean_total']}" for c, v in sorted(st['classes'].items())]
+    return "\n".join(lines)
 
 async def safe_delete(chat_id: int, msg_id: int, bot) -> None:
     try:
@@ -205,21 +590,540 @@ def wipe_context(context: ContextTypes.DEFAULT_TYPE) -> None:
     context.user_data.clear()
     if admin: context.user_data['admin'] = True
 
+#RATE LIMITS
+class AttemptLimiter:
+    """Per-chat and global token buckets with exponential lockout after repeated failures.
+    Per-chat state is one small list: [tokens, last_refill, failures, locked_until]."""
+    def __init__(self, rate: float, burst: float, global_rate: float, free_failures: int,
+                 lockout_base: float, lockout_max: float, max_entries: int = 50000):
+        self.rate, self.burst, self.global_rate = rate, burst, global_rate
+        self.free_failures, self.lockout_base, self.lockout_max = free_failures, lockout_base, lockout_max
+        self.max_entries = max_entries
+        self._chats: Dict[int, list] = {}
+        self._global = [global_rate, time.monotonic()]
+        self.allowed = self.rejected = 0
+
+    def check(self, chat_id: int) -> float:
+        """0 if the attempt may go ahead (a token is spent), else seconds until it may"""
+        now = time.monotonic()
+        st = self._chats.get(chat_id)
+        if st is None:
+            if len(self._chats) >= self.max_entries:
+                self._prune(now)
+            st = self._chats[chat_id] = [self.burst, now, 0, 0.0]
+        if st[3] > now:
+            self.rejected += 1
+            return st[3] - now
+        st[0] = min(self.burst, st[0] + (now - st[1]) * self.rate)
+        st[1] = now
+        if st[0] < 1:
+            self.rejected += 1
+            return (1 - st[0]) / self.rate
+        g = self._global
+        g[0] = min(self.global_rate, g[0] + (now - g[1]) * self.global_rate)
+        g[1] = now
+        if g[0] < 1:
+            self.rejected += 1
+            return (1 - g[0]) / self.global_rate
+        st[0] -= 1
+        g[0] -= 1
+        self.allowed += 1
+        return 0.0
+
+    def failure(self, chat_id: int) -> None:
+        st = self._chats.get(chat_id)
+        if st is None:
+            return
+        st[2] += 1
+        if st[2] > self.free_failures:
+            st[3] = time.monotonic() + min(self.lockout_max, self.lockout_base * 2 ** (st[2] - self.free_failures - 1))
+
+    def success(self, chat_id: int) -> None:
+        st = self._chats.get(chat_id)
+        if st is not None:
+            st[2], st[3] = 0, 0.0
+
+    def _prune(self, now: float) -> None:
+        # Forget chats back to a full bucket with no failure history, and failing chats idle for lockout_max
+        # since their last attempt or lockout. If that frees too little, drop the oldest tenth as well, so the
+        # O(n) scan runs once per max_entries / 10 new chats rather than on every one.
+        for k in [k for k, st in self._chats.items()
+                  if (not st[2] and st[0] + (now - st[1]) * self.rate >= self.burst)
+                  or now - max(st[1], st[3]) >= self.lockout_max]:
+            del self._chats[k]
+        excess = len(self._chats) - self.max_entries * 9 // 10
+        for k in list(itertools.islice(self._chats, max(excess, 0))):
+            del self._chats[k]
+
+    def stats(self) -> Dict[str, int]:
+        return {'allowed': self.allowed, 'rejected': self.rejected, 'tracked': len(self._chats)}
+
+RESULTS_LIMITER = AttemptLimiter(rate=RESULTS_RATE, burst=RESULTS_BURST, global_rate=RESULTS_GLOBAL_RATE,
+                                 free_failures=RESULTS_FREE_FAILURES, lockout_base=30, lockout_max=3600)
+ADMIN_LIMITER = AttemptLimiter(rate=1 / 60, burst=3, global_rate=5, free_failures=3, lockout_base=60, lockout_max=24 * 3600)
+METRICS.gauges('results_limiter', RESULTS_LIMITER.stats)
+METRICS.gauges('admin_limiter', ADMIN_LIMITER.stats)
+
+def wait_text(seconds: float) -> str:
+    return f"{int(seconds) + 1} s" if seconds < 90 else f"{int(seconds // 60) + 1} min"
+
 #MEMBERSHIP CHECK
-async def is_member(user_id: int, bot: ContextTypes.DEFAULT_TYPE) -> bool:
+class MembershipCache:
+    """LRU of user_id -> (is_member, expires_at); non-members expire sooner so joining is noticed quickly"""
+    def __init__(self, ttl: float = MEMBER_TTL, negative_ttl: float = MEMBER_NEGATIVE_TTL, size: int = MEMBER_CACHE_SIZE):
+        self.ttl, self.negative_ttl, self.size = ttl, negative_ttl, size
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, user_id: int) -> Optional[bool]:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] < time.monotonic():
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, user_id: int, member: bool) -> None:
+        self._entries[user_id] = (member, time.monotonic() + (self.ttl if member else self.negative_ttl))
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+MEMBERSHIP = MembershipCache()
+METRICS.gauges('membership_cache', MEMBERSHIP.stats)
+
+async def is_member(user_id: int, bot: ContextTypes.DEFAULT_TYPE, refresh: bool = False) -> bool:
+    if not refresh:
+        cached = MEMBERSHIP.get(user_id)
+        if cached is not None:
+            return cached
     try:
         member = await bot.get_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-        return member.status in {'member', 'administrator', 'creator'}
     except Exception:
+        # Transient API errors are not cached
         return False
+    ok = member.status in {'member', 'administrator', 'creator'}
+    MEMBERSHIP.put(user_id, ok)
+    return ok
+
+#ANNOUNCEMENTS CACHE
+def render_announcements(rows: List[dict], query: Optional[str] = None) -> str:
+    announcements = [(r['text'] or r['caption'] or '').strip() for r in rows if r['text'] or r['caption']]
+    if not announcements:
+        return f"No announcements match “{escape_markdown(query, version=1)}”." if query else "No announcements found."
+    title = f"🔍 *Announcements matching* “{escape_markdown(query, version=1)}”" if query else "📢 *Latest Announcements*"
+    return title + "\n\n" + "\n\n".join(f"*{i+1}.* {ann}" for i, ann in enumerate(announcements))
 
-async def get_bot_announcements(bot) -> List[str]:
-    rows = await run_db(get_recent_posts_full_sync, 5) 
-    return [(r['text'] or r['caption'] or '').strip() for r in rows if r['text'] or r['caption']]
+class AnnouncementsCache:
+    """Rendered first archive page (text + keyboard); admin post/edit/delete rebuild it, so the common read
+    touches neither the DB nor the renderer"""
+    def __init__(self, count: int = ANNOUNCEMENT_COUNT, max_age: Optional[float] = None):
+        self.count = count
+        # Set when several workers share the DB: another worker's post only reaches us by expiry
+        self.max_age = max_age
+        self.view: Optional[tuple] = None
+        self.built = 0.0
+        self._gen = 0
+
+    async def rebuild(self) -> tuple:
+        self._gen += 1
+        gen = self._gen
+        page = await run_db(get_posts_page_sync, self.count)
+        view = (render_announcements(page['posts']), archive_kb(page, 's'))
+        # A newer rebuild started while we were querying; let it win
+        if gen == self._gen:
+            self.view, self.built = view, time.monotonic()
+        return view
+
+    async def get(self) -> tuple:
+        """(text, markup) of the newest page"""
+        if self.view is None or (self.max_age is not None and time.monotonic() - self.built > self.max_age):
+            return await self.rebuild()
+        return self.view
+
+ANNOUNCEMENTS = AnnouncementsCache()
+
+#ANNOUNCEMENT ARCHIVE
+# Pages are keyset-paginated on the post id: "arch:<scope>:o:<id>" shows posts older than id, "n" newer ones,
+# so every page is one indexed query however many posts pile up. The active search lives in user_data.
+ARCHIVE_STATES = {'s': STUDENT_MENU, 'e': ADMIN_EDIT, 'd': ADMIN_DELETE}
+
+def post_preview(r: dict, width: int = 50) -> str:
+    text = ' '.join(html.unescape(re.sub(r'<[^>]+>', '', r['text'] or r['caption'] or '')).split())
+    return text if len(text) <= width else text[:width - 1] + '…'
+
+def archive_kb(page: Dict[str, Any], scope: str) -> InlineKeyboardMarkup:
+    posts, nav = page['posts'], []
+    if posts and page['newer']:
+        nav.append(InlineKeyboardButton("◀️ Newer", callback_data=f"arch:{scope}:n:{posts[0]['id']}"))
+    if posts and page['older']:
+        nav.append(InlineKeyboardButton("Older ▶️", callback_data=f"arch:{scope}:o:{posts[-1]['id']}"))
+    rows = [nav] if nav else []
+    if scope == 's':
+        rows += [[InlineKeyboardButton("🔍 Search", callback_data='ann_search')],
+                 [InlineKeyboardButton("🔙 Back", callback_data='back')]]
+    else:
+        rows.append([InlineKeyboardButton("🔙 Back", callback_data='back_admin')])
+    return InlineKeyboardMarkup(rows)
+
+async def show_archive(update: Update, context: ContextTypes.DEFAULT_TYPE, scope: str,
+                       before: Optional[int] = None, after: Optional[int] = None) -> int:
+    """One archive page: the student view (scope 's') or the admin edit/delete pickers ('e'/'d')"""
+    query = context.user_data.get('archive_query')
+    if scope == 's' and not query and before is None and after is None:
+        await clean_and_send(update, context, *await ANNOUNCEMENTS.get())
+        return STUDENT_MENU
+    count = ANNOUNCEMENT_COUNT if scope == 's' else RECENT_COUNT
+    page = await run_db(get_posts_page_sync, count, before, after, query)
+    if not page['posts'] and (before or after):
+        # Paged past posts deleted in the meantime; start over from the newest
+        page = await run_db(get_posts_page_sync, count, None, None, query)
+
+    if scope == 's':
+        await clean_and_send(update, context, render_announcements(page['posts'], query), archive_kb(page, 's'))
+        return STUDENT_MENU
+
+    verb = 'edit' if scope == 'e' else 'delete'
+    if not page['posts'] and not query:
+        await clean_and_send(update, context, f"❌ No posts to {verb}.", admin_kb())
+        return ADMIN_MENU
+    context.user_data['recent_posts'] = page['posts']
+    if page['posts']:
+        text = (f"{'📝' if scope == 'e' else '🗑️'} *Choose a post to {verb}:*\n\n"
+                + "\n".join(f"{i+1}. {escape_markdown(post_preview(r), version=1)}" for i, r in enumerate(page['posts']))
+                + "\n\nSend its number, or words to search.")
+    else:
+        text = f"❌ No posts match “{escape_markdown(query, version=1)}”. Send other words to search."
+    await clean_and_send(update, context, text, archive_kb(page, scope))
+    return ARCHIVE_STATES[scope]
+
+async def archive_nav(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    q = update.callback_query
+    _, scope, direction, post_id = q.data.split(':')
+    if scope != 's' and not context.user_data.get('admin'):
+        # Edit/delete pickers are admin-only, whatever callback data arrives
+        await q.answer("⛔ Admins only.")
+        return STUDENT_MENU
+    if scope == 's' and not await is_member(q.from_user.id, context.bot):
+        await clean_and_send(update, context, "⛔ You must join the channel first!", join_channel_kb())
+        return STUDENT_MENU
+    if direction == 'o':
+        return await show_archive(update, context, scope, before=int(post_id))
+    return await show_archive(update, context, scope, after=int(post_id))
+
+async def archive_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await safe_delete(update.message.chat_id, update.message.message_id, context.bot)
+    context.user_data['archive_query'] = update.message.text.strip()[:100]
+    return await show_archive(update, context, 's')
+
+#BROADCAST
+class TokenBucket:
+    """Async token bucket: `rate` sends per second, bursting up to `capacity`"""
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate, self.capacity = rate, capacity or rate
+        self.tokens, self.updated = self.capacity, time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds` (Telegram flood control)"""
+        self.tokens, self.updated = 0, max(self.updated, time.monotonic() + seconds)
+
+BROADCAST_BUCKET = TokenBucket(BROADCAST_RATE)
+
+def retry_after_seconds(e: RetryAfter) -> float:
+    ra = e.retry_after
+    return ra.total_seconds() if hasattr(ra, 'total_seconds') else float(ra)
+
+async def deliver(bot, chat_id: int, text: str, parse_mode: str = "HTML") -> str:
+    """Send one broadcast message; returns 'sent', 'blocked' (chat is gone) or 'failed'"""
+    for attempt in range(BROADCAST_RETRIES):
+        await BROADCAST_BUCKET.acquire()
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode=parse_mode)
+            return 'sent'
+        except RetryAfter as e:
+            # Flood control is global: stall every sender, not just this one
+            BROADCAST_BUCKET.pause(retry_after_seconds(e))
+        except Forbidden:
+            return 'blocked'
+        except BadRequest as e:
+            if 'chat not found' in str(e).lower():
+                return 'blocked'
+            logging.warning("broadcast to %s rejected: %s", chat_id, e)
+            return 'failed'
+        except (TimedOut, NetworkError):
+            await asyncio.sleep(2 ** attempt)
+    return 'failed'
+
+async def run_broadcast_job(bot, job_id: int) -> None:
+    """Drain one persisted broadcast job; safe to call again after a restart"""
+    job = await run_db(get_broadcast_sync, job_id)
+    if not job or job['status'] != 'running':
+        return
+    counts = await run_db(broadcast_counts_sync, job_id)
+    total, last = sum(counts.values()), time.monotonic()
+    sem = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    inflight, done = set(), []
+
+    async def one(chat_id: int) -> None:
+        try:
+            # Mark each chat just before its send: a crash then writes off only chats actually tried, never the rest of the batch
+            await run_db(mark_deliveries_sync, job_id, [('sending', chat_id)])
+            outcome = await deliver(bot, chat_id, job['text'])
+        except Exception:
+            # One bad chat must not take the job down with it
+            logging.exception("broadcast to %s failed", chat_id)
+            outcome = 'failed'
+        finally:
+            sem.release()
+        done.append((outcome, chat_id))
+        counts[outcome] = counts.get(outcome, 0) + 1
+
+    async def flush() -> None:
+        nonlocal done, last
+        if done:
+            batch, done = done, []
+            try:
+                await run_db(mark_deliveries_sync, job_id, batch)
+            except Exception:
+                done[:0] = batch  # kept for the next flush
+                logging.exception("recording %d broadcast outcomes failed", len(batch))
+        if job['status_msg'] and time.monotonic() - last >= BROADCAST_PROGRESS_EVERY:
+            last = time.monotonic()
+            finished = sum(counts.get(k, 0) for k in ('sent', 'failed', 'blocked', 'unknown'))
+            try: await bot.edit_message_text(f"📤 Broadcasting... {finished}/{total} (✅ {counts.get('sent', 0)} ❌ {counts.get('failed', 0)} 🚫 {counts.get('blocked', 0)})",
+                                             chat_id=job['status_chat'], message_id=job['status_msg'])
+            except Exception: pass
+
+    try:
+        # Claiming the next batch overlaps with the tail of the previous one, so the send pipeline never drains between batches
+        while batch := await run_db(claim_deliveries_sync, job_id, BROADCAST_BATCH):
+            for chat_id in batch:
+                await sem.acquire()
+                task = asyncio.create_task(one(chat_id))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+            await flush()
+        if inflight:
+            await asyncio.gather(*inflight)
+        await flush()
+        if done:
+            logging.error("broadcast job %s: %d outcomes could not be recorded, left for the next restart", job_id, len(done))
+            return
+        dead = await run_db(finish_broadcast_sync, job_id)
+        if dead:
+            await run_db(remove_users_sync, dead)
+            KNOWN_USERS.discard(dead)
+    except asyncio.CancelledError:
+        # Shutting down: record what finished; resuming puts claimed chats back to 'pending' and writes
+        # off the ones cut off mid-send as 'unknown'
+        for task in inflight:
+            task.cancel()
+        await asyncio.gather(*inflight, return_exceptions=True)
+        try: await run_db(mark_deliveries_sync, job_id, done)
+        except Exception: logging.exception("saving progress of broadcast job %s failed", job_id)
+        logging.info("broadcast job %s stopped, will resume on restart", job_id)
+        raise
+    except Exception:
+        logging.exception("broadcast job %s failed", job_id)
+        return
+    counts = await run_db(broadcast_counts_sync, job_id)
+    logging.info("broadcast job %s finished: %s", job_id, counts)
+    if job['status_msg']:
+        try: await bot.edit_message_text(
+                f"✅ Broadcast finished: {counts.get('sent', 0)} sent, {counts.get('failed', 0)} failed, "
+                f"{counts.get('blocked', 0)} blocked (removed)" + (f", {counts['unknown']} interrupted by a restart." if counts.get('unknown') else "."),
+                chat_id=job['status_chat'], message_id=job['status_msg'])
+        except Exception: pass
+
+class BroadcastTasks:
+    """Broadcast jobs running in this process. Owned here rather than by the Application, whose stop()
+    waits for its own tasks: a deploy would otherwise hang until every send is done"""
+    def __init__(self):
+        self.tasks: set = set()
+
+    def spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+BROADCASTS = BroadcastTasks()
+
+#SUPPORT QUEUE
+# Tickets are committed to SQLite before the student is answered; a background dispatcher delivers them to
+# SUPPORT_ID, optionally as digests, retrying with exponential backoff. Nothing is lost if Telegram or the bot is down.
+def render_ticket(t: dict) -> str:
+    issue = t['issue'] if len(t['issue']) <= 3000 else t['issue'][:3000] + '…'
+    return (f"🆘 *Ticket #{t['id']}*\n"
+            f"*Student:* {escape_markdown(t['name'], version=1)}\n"
+            f"*Username:* {escape_markdown(t['username'], version=1)}\n\n"
+            f"*Problem:*\n{escape_markdown(issue, version=1)}")
+
+def ticket_messages(tickets: List[dict], digest: bool) -> List[tuple]:
+    """(text, ticket ids) per message to send: one per ticket, or digests packed under Telegram's 4096 chars"""
+    if not digest:
+        return [(render_ticket(t), [t['id']]) for t in tickets]
+    out, parts, ids = [], [], []
+    for t in tickets:
+        part = render_ticket(t)
+        if parts and sum(len(p) + 8 for p in parts) + len(part) > 3900:
+            out.append((parts, ids))
+            parts, ids = [], []
+        parts.append(part)
+        ids.append(t['id'])
+    if parts:
+        out.append((parts, ids))
+    return [(f"📬 *{len(ids)} new support tickets*\n\n" + "\n\n———\n\n".join(p) if len(ids) > 1 else p[0], ids)
+            for p, ids in out]
+
+class SupportDispatcher:
+    """Background delivery of queued tickets to the IT chat"""
+    def __init__(self, digest: float = SUPPORT_DIGEST):
+        self.digest = digest
+        self.sent = self.retried = self.failed = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def poke(self) -> None:
+        """A ticket was queued in this process; deliver without waiting for the next poll"""
+        if self._wake:
+            self._wake.set()
+
+    async def dispatch(self, bot) -> int:
+        """One round: send every due ticket and record the outcome. Returns tickets delivered."""
+        due = await run_db(due_tickets_sync, time.time(), SUPPORT_BATCH)
+        if not due:
+            return 0
+        attempts = {t['id']: t['attempts'] for t in due}
+        outcomes, delivered = [], 0
+        messages = ticket_messages(due, self.digest > 0)
+        for n, (text, ids) in enumerate(messages):
+            try:
+                await bot.send_message(SUPPORT_ID, text, parse_mode='Markdown')
+            except RetryAfter as e:
+                # Flood control: everything left in this round waits it out
+                wait = retry_after_seconds(e)
+                for _, rest in messages[n:]:
+                    outcomes += self._retry(rest, attempts, wait)
+                break
+            except Exception as e:
+                # Timeouts, network errors, a misconfigured SUPPORT_ID: all worth retrying for a while
+                logging.warning("support delivery of tickets %s failed: %s", ids, e)
+                outcomes += self._retry(ids, attempts)
+                continue
+            outcomes += [('sent', attempts[i] + 1, 0, i) for i in ids]
+            delivered += len(ids)
+        self.sent += delivered
+        await run_db(mark_tickets_sync, outcomes)
+        return delivered
+
+    def _retry(self, ids: List[int], attempts: Dict[int, int], wait: Optional[float] = None) -> List[tuple]:
+        rows = []
+        for i in ids:
+            n = attempts[i] + 1
+            if n >= SUPPORT_RETRIES:
+                self.failed += 1
+                logging.error("support ticket %s undelivered after %d attempts", i, n)
+                rows.append(('failed', n, 0, i))
+            else:
+                self.retried += 1
+                rows.append(('pending', n, time.time() + (wait or min(SUPPORT_BACKOFF_MAX, SUPPORT_BACKOFF * 2 ** (n - 1))), i))
+        return rows
+
+    async def _run(self, bot) -> None:
+        while not self._stop.is_set():
+            try:
+                await self.dispatch(bot)
+            except Exception:
+                logging.exception("support dispatch failed")
+            if not await wait_set(self._wake, SUPPORT_POLL):
+                continue
+            self._wake.clear()
+            if self.digest:
+                # Let the burst build up into one digest (cut short by shutdown)
+                await wait_set(self._stop, self.digest)
+
+    def start(self, bot) -> None:
+        self._wake, self._stop = asyncio.Event(), asyncio.Event()
+        self._task = asyncio.create_task(self._run(bot), name='support dispatcher')
+
+    async def stop(self) -> None:
+        if self._task:
+            await stop_loop(self._task, self._stop, self._wake)
+
+    def stats(self) -> Dict[str, int]:
+        return {'sent': self.sent, 'retried': self.retried, 'failed': self.failed}
+
+SUPPORT = SupportDispatcher()
+METRICS.gauges('support', SUPPORT.stats)
+
+async def show_tickets(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                       before: Optional[int] = None, after: Optional[int] = None) -> int:
+    page = await run_db(get_tickets_page_sync, TICKET_PAGE, before, after)
+    if not page['tickets'] and (before or after):
+        page = await run_db(get_tickets_page_sync, TICKET_PAGE)
+    counts = await run_db(ticket_counts_sync)
+    head = f"🎫 *Support tickets:* {counts.get('open', 0)} open, {counts.get('resolved', 0)} resolved"
+    if counts.get('pending') or counts.get('failed'):
+        head += f"\n📤 {counts.get('pending', 0)} waiting for delivery, {counts.get('failed', 0)} undelivered"
+    icon = {'sent': '✉️', 'pending': '⏳', 'failed': '⚠️'}
+    lines = [f"{icon.get(t['delivery'], '')} *#{t['id']}* {escape_markdown(t['name'], version=1)} "
+             f"({escape_markdown(t['username'], version=1)}): {escape_markdown(post_preview({'text': t['issue'], 'caption': ''}, 80), version=1)}"
+             for t in page['tickets']]
+    text = head + "\n\n" + ("\n".join(lines) if lines else "No open tickets. 🎉")
+
+    tickets, rows = page['tickets'], []
+    for t in tickets:
+        rows.append([InlineKeyboardButton(f"✅ Resolve #{t['id']}", callback_data=f"tix:r:{t['id']}")])
+    nav = []
+    if tickets and page['newer']:
+        nav.append(InlineKeyboardButton("◀️ Newer", callback_data=f"tix:n:{tickets[0]['id']}"))
+    if tickets and page['older']:
+        nav.append(InlineKeyboardButton("Older ▶️", callback_data=f"tix:o:{tickets[-1]['id']}"))
+    if nav:
+        rows.append(nav)
+    rows.append([InlineKeyboardButton("🔙 Back", callback_data='back_admin')])
+    await clean_and_send(update, context, text, InlineKeyboardMarkup(rows))
+    return ADMIN_MENU
+
+async def admin_tickets(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    _, action, ticket_id = update.callback_query.data.split(':')
+    ticket_id = int(ticket_id)
+    if action == 'o':
+        return await show_tickets(update, context, before=ticket_id)
+    if action == 'n':
+        return await show_tickets(update, context, after=ticket_id)
+    chat_id = await run_db(resolve_ticket_sync, ticket_id)
+    if chat_id is not None:
+        try: await context.bot.send_message(chat_id, f"✅ Your support ticket #{ticket_id} has been resolved by the IT team.")
+        except Exception as e: logging.info("could not notify %s about ticket %s: %s", chat_id, ticket_id, e)
+    return await show_tickets(update, context)
 
 #STUDENT HANDLERS
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    await run_db(save_user_sync, update.effective_chat.id)
+    KNOWN_USERS.add(update.effective_chat.id)
     # FIX: Ensure we wipe everything including potential admin leftovers on start
     await wipe_everything(context, update.effective_chat.id)
     wipe_context(context)
@@ -243,10 +1147,11 @@ async def student_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             await clean_and_send(update, context, "✏️ Enter your full name:", student_sub_kb())
             return RESULTS_NAME
         case 'announcements':
-            announcements = await get_bot_announcements(update.get_bot())
-            text = "📢 *Latest Announcements*\n\n" + "\n\n".join(f"*{i+1}.* {ann}" for i, ann in enumerate(announcements)) if announcements else "No announcements found."
-            await clean_and_send(update, context, text, student_sub_kb())
-            return STUDENT_MENU
+            context.user_data.pop('archive_query', None)
+            return await show_archive(update, context, 's')
+        case 'ann_search':
+            await clean_and_send(update, context, "🔍 Send words to search past announcements for:", student_sub_kb())
+            return ANNOUNCE_SEARCH
         case 'about_school':
             await clean_and_send(update, context, SCHOOL_INFO, student_sub_kb())
             return STUDENT_MENU
@@ -257,7 +1162,7 @@ async def student_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
             await clean_and_send(update, context, "✏️ Please describe your problem:", student_sub_kb())
             return SUPPORT_ISSUE
         case 'back':
-            await wipe_everything(context, q.message.chat_id)
+            await wipe_everything(context, q.message.chat.id, keep=menu_of(update))
             await clean_and_send(update, context, "Main menu", student_main_kb())
             return STUDENT_MENU
     return STUDENT_MENU
@@ -271,23 +1176,32 @@ async def results_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 async def results_id(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await safe_delete(update.message.chat_id, update.message.message_id, context.bot) 
     name, st_id = context.user_data['name'], update.message.text
+
+    # Rejected guesses stop here, before any executor or DB work
+    wait = RESULTS_LIMITER.check(update.effective_chat.id)
+    if wait:
+        await clean_and_send(update, context, f"⏳ Too many attempts. Please try again in {wait_text(wait)}.", student_sub_kb())
+        return STUDENT_MENU
     
     prog = await update.message.reply_text("🔍 Searching...")
     track_result(context, prog.message_id, prog.chat_id)
     
-    res = get_student_results(name, st_id)
+    await WARMUP.wait('results')
+    res = await run_db(get_student_results, name, st_id)
     
     if not res:
+        RESULTS_LIMITER.failure(update.effective_chat.id)
         await clean_and_send(update, context, "❌ No results found. Check name/ID.", student_sub_kb())
         return STUDENT_MENU
+    RESULTS_LIMITER.success(update.effective_chat.id)
     
-    txt = f"📊 *Results for {name}*\n\n" + "\n".join(f"• {s}: *{score}*" for s, score in res['subs'].items()) + f"\n\n📈 Total: {res['total']} 📊 Average: {res['avg']}%"
+    txt = render_results(name, res)
     
     await cleanup_all_messages(context) 
     msg = await update.message.reply_text(txt, parse_mode='Markdown', reply_markup=student_sub_kb())
     track_result(context, msg.message_id, msg.chat_id)
     
-    asyncio.create_task(self_destruct_results(context, 60))
+    RESULT_EXPIRY.schedule(update.effective_user.id, RESULT_TTL)
     return STUDENT_MENU
 
 async def support_issue(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -302,19 +1216,11 @@ async def support_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     user = update.effective_user
     username = f"@{user.username}" if user.username else str(user.id)
     
-    support_text = (
-        f"🆘 *NEW SUPPORT TICKET*\n\n"
-        f"*Student:* {escape_markdown(name, version=1)}\n"
-        f"*Username:* {escape_markdown(username, version=1)}\n\n"
-        f"*Problem:*\n{escape_markdown(issue, version=1)}"
-    )
-    
-    try:
-        await update.get_bot().send_message(SUPPORT_ID, support_text, parse_mode='Markdown')
-        await clean_and_send(update, context, "✅ Your issue has been sent to the IT team!", student_main_kb())
-    except Exception as e:
-        logging.error("support send failed: %s", e)
-        await clean_and_send(update, context, "❌ Failed to send. Please try again later.", student_main_kb())
+    # Queued first, delivered by SUPPORT in the background: a Telegram hiccup can no longer lose the ticket
+    ticket_id = await run_db(create_ticket_sync, update.effective_chat.id, username, name, issue)
+    SUPPORT.poke()
+    await clean_and_send(update, context, f"✅ Your issue has been received as ticket #{ticket_id}. The IT team will contact you.",
+                         student_main_kb())
     
     context.user_data.clear()
     return STUDENT_MENU
@@ -322,7 +1228,8 @@ async def support_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 async def check_join(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     q = update.callback_query
     await q.answer()
-    if await is_member(q.from_user.id, context.bot):
+    # "I have joined" must see the new membership right away, so skip the cache
+    if await is_member(q.from_user.id, context.bot, refresh=True):
         await clean_and_send(update, context, "✅ Welcome! You can now use the bot.", student_main_kb())
         return STUDENT_MENU
     await clean_and_send(update, context, "⛔ You must join the channel first!", join_channel_kb())
@@ -336,18 +1243,24 @@ async def force_admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     wipe_context(context)
     
     m = await update.message.reply_text("🔐 Enter admin password:")
-    context.user_data.setdefault('to_clean', []).append(m.message_id)
+    track_admin(context, m.message_id, m.chat_id)
     return ADMIN_LOGIN
 
 #ADMIN HANDLERS
 async def admin_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     m = await update.message.reply_text("🔐 Enter admin password:")
-    context.user_data.setdefault('to_clean', []).append(m.message_id)
+    track_admin(context, m.message_id, m.chat_id)
     return ADMIN_LOGIN
 
 async def admin_login(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await safe_delete(update.message.chat_id, update.message.message_id, context.bot)
-    if update.message.text == ADMIN_PASS:
+    wait = ADMIN_LIMITER.check(update.message.chat_id)
+    if wait:
+        m = await update.message.reply_text(f"⛔ Too many attempts. Try again in {wait_text(wait)} or /cancel.")
+        track_admin(context, m.message_id, m.chat_id)
+        return ADMIN_LOGIN
+    if hmac.compare_digest((update.message.text or '').encode(), ADMIN_PASS.encode()):
+        ADMIN_LIMITER.success(update.message.chat_id)
         # Success: Wipe the "Enter password" message and any lingering student stuff
         await wipe_admin_trail(context, update.message.chat_id)
         await wipe_everything(context, update.message.chat_id)
@@ -355,11 +1268,12 @@ async def admin_login(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
         context.user_data['admin'] = True
         
         m = await update.message.reply_text("✅ Admin access granted.", reply_markup=admin_kb())
-        context.user_data.setdefault('to_clean', []).append(m.message_id)
+        track_admin(context, m.message_id, m.chat_id)
         return ADMIN_MENU
     
+    ADMIN_LIMITER.failure(update.message.chat_id)
     m = await update.message.reply_text("❌ Wrong password. Try again or /cancel:")
-    context.user_data.setdefault('to_clean', []).append(m.message_id)
+    track_admin(context, m.message_id, m.chat_id)
     return ADMIN_LOGIN
 
 async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -367,38 +1281,39 @@ async def admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await q.answer()
     match q.data:
         case 'back_admin':
-            await safe_delete(q.message.chat_id, q.message.message_id, context.bot)
+            await safe_delete(q.message.chat.id, q.message.message_id, context.bot)
             msg = await context.bot.send_message(q.from_user.id, "Admin menu", reply_markup=admin_kb())
-            context.user_data['to_clean'] = [msg.message_id]
+            context.user_data['to_clean'] = []
+            track_admin(context, msg.message_id, msg.chat_id)
             return ADMIN_MENU
         case 'post':
             await q.message.reply_text("✍️ Send your announcement text (or photo + caption):", reply_markup=ReplyKeyboardRemove())
             context.user_data['post_gather'] = True
             return ADMIN_POST
         case 'edit_post':
-            recent = await run_db(get_recent_posts_full_sync, RECENT_COUNT)
-            if not recent:
-                await clean_and_send(update, context, "❌ No posts to edit.", admin_kb())
-                return ADMIN_MENU
-            text = "📝 *Choose a post to edit:*\n\n" + "\n".join(f"{i+1}. {r['text'] or r['caption'][:50]}" for i, r in enumerate(recent))
-            await clean_and_send(update, context, text, None)
-            context.user_data['recent_posts'] = recent
-            return ADMIN_EDIT
+            context.user_data.pop('archive_query', None)
+            context.user_data.pop('edit_post', None)
+            return await show_archive(update, context, 'e')
         case 'delete_post':
-            recent = await run_db(get_recent_posts_full_sync, RECENT_COUNT)
-            if not recent:
-                await clean_and_send(update, context, "❌ No posts to delete.", admin_kb())
-                return ADMIN_MENU
-            text = "🗑️ *Choose a post to delete:*\n\n" + "\n".join(f"{i+1}. {r['text'] or r['caption'][:50]}" for i, r in enumerate(recent))
-            await clean_and_send(update, context, text, None)
-            context.user_data['recent_posts'] = recent
-            return ADMIN_DELETE
+            context.user_data.pop('archive_query', None)
+            return await show_archive(update, context, 'd')
+        case 'import_results':
+            await clean_and_send(update, context, "📥 Send the results sheet as a *.csv* or *.xlsx* file.\n"
+                                 "Columns: `student_id`, `name`, optional `class`, then one column per subject.", admin_back_kb())
+            return ADMIN_IMPORT
+        case 'tickets':
+            return await show_tickets(update, context)
+        case 'stats':
+            await WARMUP.wait('results')
+            await run_db(RESULTS.refresh)
+            await clean_and_send(update, context, render_stats(), admin_back_kb())
+            return ADMIN_MENU
         case 'logout':
             # FIX: Explicitly delete the menu button clicked immediately
             try: await q.message.delete()
             except: pass
             
-            await wipe_everything(context, q.message.chat_id)
+            await wipe_everything(context, q.message.chat.id)
             wipe_context(context)
             await context.bot.send_message(q.from_user.id, "🔒 Logged out.\n👋 Welcome back to student mode.", reply_markup=student_main_kb())
             return STUDENT_MENU
@@ -420,39 +1335,84 @@ async def admin_post(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         channel_msg = await context.bot.send_message(chat_id=CHANNEL_ID, text=text, parse_mode="HTML")
 
     await run_db(save_post_sync, CHANNEL_ID, channel_msg.message_id, text if not file_id else "", caption or text if file_id else "", file_id)
+    await ANNOUNCEMENTS.rebuild()
     
+    await KNOWN_USERS.flush()
     users = await run_db(get_all_users_sync)
     broadcast_text = f"📢 *New Announcement*\n\n{text or caption}"
     
-    for chat_id in users:
-        try:
-            await context.bot.send_message(chat_id=chat_id, text=broadcast_text, parse_mode="HTML")
-        except Exception as e:
-            await run_db(remove_user_sync, chat_id)
+    # The broadcast is persisted as a job and drained in the background, so the admin gets the menu back right away
+    status = await update.message.reply_text(f"📤 Broadcasting to {len(users)} users...")
+    job_id = await run_db(create_broadcast_sync, broadcast_text, users, status.chat_id, status.message_id)
+    BROADCASTS.spawn(run_broadcast_job(context.bot, job_id))
 
     context.user_data.pop('post_gather', None)
-    await update.message.reply_text(f"✅ Posted to channel and broadcast to {len(users)} users!", reply_markup=admin_kb())
+    await update.message.reply_text("✅ Posted to channel. Broadcast is running in the background.", reply_markup=admin_kb())
+    return ADMIN_MENU
+
+async def admin_import(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    doc = update.message.document
+    ext = os.path.splitext(doc.file_name or '')[1].lower()
+    if ext not in ('.csv', '.xlsx', '.xlsm'):
+        m = await update.message.reply_text("❌ Please send a .csv or .xlsx file.", reply_markup=admin_back_kb())
+        track_admin(context, m.message_id, m.chat_id)
+        return ADMIN_IMPORT
+
+    prog = await update.message.reply_text("⏳ Importing results...")
+    track_admin(context, prog.message_id, prog.chat_id)
+    # download_to_drive() writes the file on the loop thread; fetch the bytes and write them on the executor
+    data = await (await doc.get_file()).download_as_bytearray()
+    path = await run_db(save_upload_sync, bytes(data), ext)
+    try:
+        import results_import
+        await WARMUP.wait('results')  # never race the start-up import of results.csv
+        report = await run_db(results_import.import_results_sync, path, SUBJECTS, timeout=IMPORT_TIMEOUT)
+        await run_db(set_meta_sync, 'results_uploaded', time.time())  # results.csv older than this stays unimported
+        await run_db(RESULTS.refresh, True)
+    except ValueError as e:
+        m = await update.message.reply_text(f"❌ Import failed, nothing was changed: {e}", reply_markup=admin_back_kb())
+        track_admin(context, m.message_id, m.chat_id)
+        return ADMIN_IMPORT
+    except Exception as e:
+        logging.exception("results import of %s failed", doc.file_name)
+        m = await update.message.reply_text(f"❌ Import failed ({type(e).__name__}), check the logs before retrying.",
+                                            reply_markup=admin_back_kb())
+        track_admin(context, m.message_id, m.chat_id)
+        return ADMIN_IMPORT
+    finally:
+        await run_db(os.remove, path)
+
+    lines = [f"✅ Imported {report['imported']} students ({report['rejected']} rows rejected, {report['warnings']} cells skipped)."]
+    if report['fuzzy']:
+        lines.append("Matched columns: " + ", ".join(f"{h} → {s}" for h, s in report['fuzzy'].items()))
+    if report['ignored']:
+        lines.append("Ignored columns: " + ", ".join(report['ignored']))
+    if report['missing_subjects']:
+        lines.append("Subjects not in file: " + ", ".join(report['missing_subjects']))
+    lines += report['errors'][:10]
+    m = await update.message.reply_text("\n".join(lines)[:4000], reply_markup=admin_kb())
+    track_admin(context, m.message_id, m.chat_id)
     return ADMIN_MENU
 
 async def admin_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     recent = context.user_data.get('recent_posts', [])
-    if not update.message.text or not update.message.text.isdigit():
-        m = await update.message.reply_text("❌ Send the **number** of the post to delete.")
-        context.user_data.setdefault('to_clean', []).append(m.message_id)
-        return ADMIN_DELETE
+    if not update.message.text.strip().isdigit():
+        context.user_data['archive_query'] = update.message.text.strip()[:100]
+        return await show_archive(update, context, 'd')
         
     idx = int(update.message.text) - 1
     if idx < 0 or idx >= len(recent):
         m = await update.message.reply_text("❌ Invalid number.")
-        context.user_data.setdefault('to_clean', []).append(m.message_id)
+        track_admin(context, m.message_id, m.chat_id)
         return ADMIN_DELETE
         
     post = recent[idx]
     await safe_delete(CHANNEL_ID, post['message_id'], context.bot)
     await run_db(delete_post_by_id_sync, post['id'])
+    await ANNOUNCEMENTS.rebuild()
     
     ms = await update.message.reply_text("✅ Post deleted.", reply_markup=admin_kb())
-    context.user_data.setdefault('to_clean', []).append(ms.message_id)
+    track_admin(context, ms.message_id, ms.chat_id)
     return ADMIN_MENU
 
 async def admin_edit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -461,87 +1421,263 @@ async def admin_edit(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         idx = int(update.message.text) - 1
         if idx < 0 or idx >= len(recent):
             m = await update.message.reply_text("❌ Invalid number.")
-            context.user_data.setdefault('to_clean', []).append(m.message_id)
+            track_admin(context, m.message_id, m.chat_id)
             return ADMIN_EDIT
             
         context.user_data['edit_post'] = recent[idx]
         m = await update.message.reply_text("✏️ Send the new text for this post:", reply_markup=admin_back_kb())
-        context.user_data.setdefault('to_clean', []).append(m.message_id)
+        track_admin(context, m.message_id, m.chat_id)
         return ADMIN_EDIT
 
     post = context.user_data.get('edit_post')
     if not post:
-        m = await update.message.reply_text("❌ No post selected. /admin to restart.", reply_markup=admin_kb())
-        return ADMIN_MENU
+        context.user_data['archive_query'] = update.message.text.strip()[:100]
+        return await show_archive(update, context, 'e')
         
     new_text = update.message.text_html
     await context.bot.edit_message_text(chat_id=CHANNEL_ID, message_id=post['message_id'], text=new_text, parse_mode="HTML")
     
-    with sqlite3.connect('posts.db') as conn:
-        conn.execute("UPDATE posts SET text = ?, caption = '' WHERE id = ?", (new_text, post['id']))
-        conn.commit()
+    await run_db(update_post_text_sync, post['id'], new_text)
+    await ANNOUNCEMENTS.rebuild()
         
     ms = await update.message.reply_text("✅ Post edited!", reply_markup=admin_kb())
-    context.user_data.setdefault('to_clean', []).append(ms.message_id)
+    track_admin(context, ms.message_id, ms.chat_id)
     context.user_data.pop('edit_post', None)
     return ADMIN_MENU
 
-async def self_destruct_results(context: ContextTypes.DEFAULT_TYPE, delay: int = 60) -> None:
-    await asyncio.sleep(delay)
-    await delete_results(context)
+async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await context.bot.send_message(update.effective_chat.id, "Cancelled.", reply_markup=student_main_kb())
+    return STUDENT_MENU
 
-CONVERSATION
+#CONVERSATION
 def build_conv() -> ConversationHandler:
     back_handler = CallbackQueryHandler(student_menu, pattern='^back$')
+    # Students page the public archive only; the edit/delete pickers are only handled in their admin states
+    student_archive = CallbackQueryHandler(archive_nav, pattern=r'^arch:s:[on]:\d+$')
+    admin_archive = CallbackQueryHandler(archive_nav, pattern=r'^arch:[ed]:[on]:\d+$')
 
     return ConversationHandler(
         entry_points=[CommandHandler('start', start), CommandHandler('admin', admin_cmd)],
         states={
             STUDENT_MENU: [
-                CallbackQueryHandler(student_menu, pattern='^(results|announcements|about_school|about_bot|support|back)$'),
+                CallbackQueryHandler(student_menu, pattern='^(results|announcements|ann_search|about_school|about_bot|support|back)$'),
                 CallbackQueryHandler(check_join, pattern='^check_join$'),
+                student_archive,
                 MessageHandler(filters.TEXT & ~filters.COMMAND, please_use_buttons)
             ],
             RESULTS_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, results_name), back_handler],
             RESULTS_ID:   [MessageHandler(filters.TEXT & ~filters.COMMAND, results_id), back_handler],
             SUPPORT_ISSUE:[MessageHandler(filters.TEXT & ~filters.COMMAND, support_issue), back_handler],
             SUPPORT_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, support_name), back_handler],
+            ANNOUNCE_SEARCH: [MessageHandler(filters.TEXT & ~filters.COMMAND, archive_search), back_handler],
             
             ADMIN_LOGIN: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_login)],
-            ADMIN_MENU: [CallbackQueryHandler(admin_menu)],
+            ADMIN_MENU: [CallbackQueryHandler(admin_tickets, pattern=r'^tix:[onr]:\d+$'), CallbackQueryHandler(admin_menu)],
             ADMIN_POST: [MessageHandler(filters.TEXT | filters.PHOTO, admin_post)],
-            ADMIN_EDIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_edit)],
-            ADMIN_DELETE: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_delete)],
+            ADMIN_EDIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_edit), admin_archive,
+                         CallbackQueryHandler(admin_menu, pattern='^back_admin$')],
+            ADMIN_DELETE: [MessageHandler(filters.TEXT & ~filters.COMMAND, admin_delete), admin_archive,
+                           CallbackQueryHandler(admin_menu, pattern='^back_admin$')],
+            ADMIN_IMPORT: [MessageHandler(filters.Document.ALL, admin_import), CallbackQueryHandler(admin_menu, pattern='^back_admin$')],
         },
         fallbacks=[
-            CommandHandler('cancel', lambda u, c: c.bot.send_message(u.effective_chat.id, "Cancelled.", reply_markup=student_main_kb()) or STUDENT_MENU),
+            CommandHandler('cancel', cancel),
             CommandHandler('admin', force_admin)
         ],
         per_chat=True,
-        per_message=False
+        per_message=False,
+        name='main',
+        persistent=PERSISTENCE != 'none'
     )
 
+#STARTUP
+# Polling/webhook starts before any of this is done: schema check, results import and cache warming run
+# in the background. run_db waits for 'db' on its own; handlers await the other steps only where needed.
+class Warmup:
+    """Background start-up steps, each with a readiness event: db -> (results, users, announcements)"""
+    def __init__(self):
+        self.ready = {step: asyncio.Event() for step in ('db', 'results', 'users', 'announcements')}
+        self.db_ready = self.ready['db']
+        self.took: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._t0 = 0.0
+
+    def start(self) -> None:
+        """Idempotent; called from post_init, or earlier by the first run_db (persistence loads in initialize)"""
+        if self._task is None:
+            self._t0 = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+
+    async def wait(self, step: str) -> None:
+        event = self.ready[step]
+        if not event.is_set():
+            self.start()
+            await event.wait()
+
+    async def _step(self, step: str, work) -> None:
+        try:
+            await work
+        except Exception:
+            # Waiters are released anyway; their own DB calls then surface the error
+            logging.exception("warm-up step %s failed", step)
+        finally:
+            self.took[step] = round(time.monotonic() - self._t0, 3)
+            self.ready[step].set()
+
+    async def _load_users(self) -> None:
+        KNOWN_USERS.load(await BLOCKING.run(get_all_users_sync))
+
+    async def _run(self) -> None:
+        await self._step('db', BLOCKING.run(init_db, timeout=IMPORT_TIMEOUT))
+        await asyncio.gather(self._step('results', BLOCKING.run(bootstrap_results, timeout=IMPORT_TIMEOUT)),
+                             self._step('users', self._load_users()),
+                             self._step('announcements', ANNOUNCEMENTS.rebuild()))
+        logging.info("Warm-up finished (seconds since start): %s", self.took)
+
+WARMUP = Warmup()
+
+def bootstrap_results() -> None:
+    """Create the sample results.csv on first run, then load the results index (which imports the file if it changed)"""
+    if not os.path.exists(RESULTS_FILE):
+        with open(RESULTS_FILE, 'w', newline='', encoding='utf-8') as f:
+            w = csv.writer(f)
+            w.writerow(['student_id', 'name', *SUBJECTS])
+            w.writerow(['STD001', 'Abel Tesfaye', '95', '88', '92', '90', '87'] + [''] * (len(SUBJECTS) - 5))
+    RESULTS.refresh(force=True)
+
+async def resume_broadcasts(bot) -> None:
+    for job_id in await run_db(get_running_broadcasts_sync):
+        logging.info("Resuming broadcast job %s", job_id)
+        BROADCASTS.spawn(run_broadcast_job(bot, job_id))
+
 #MAIN
+async def post_init(app: Application) -> None:
+    WARMUP.start()
+    KNOWN_USERS.start()
+    PENDING_DELETES.start(app.bot)
+    RESULT_EXPIRY.start(app)
+    if METRICS_PORT:
+        await METRICS_SERVER.start(METRICS_HOST, METRICS_PORT + (WORKER_INDEX or 0))
+    # With several workers only worker 0 resumes jobs and delivers tickets; claims are atomic, so a job drained by two processes is still sent once
+    if WORKER_INDEX in (None, 0):
+        SUPPORT.start(app.bot)
+        BROADCASTS.spawn(resume_broadcasts(app.bot))
+    if LOOP_DEBUG:
+        # Any handler that does file/SQLite work on the loop thread shows up as "Executing ... took" warnings;
+        # tests/test_event_loop.py turns this on and fails on them
+        loop = asyncio.get_running_loop()
+        loop.set_debug(True)
+        loop.slow_callback_duration = LOOP_SLOW_CALLBACK
+        logging.getLogger('asyncio').setLevel(logging.WARNING)
+
+async def post_stop(app: Application) -> None:
+    await BROADCASTS.stop()
+
+async def post_shutdown(app: Application) -> None:
+    await METRICS_SERVER.stop()
+    await SUPPORT.stop()
+    await RESULT_EXPIRY.stop()
+    await KNOWN_USERS.stop()
+    await PENDING_DELETES.stop()
+    logging.info("Executor stats: %s", BLOCKING.stats())
+    logging.info("Membership cache: %s", MEMBERSHIP.stats())
+    logging.info("Rate limits: results %s, admin login %s", RESULTS_LIMITER.stats(), ADMIN_LIMITER.stats())
+    BLOCKING.shutdown()
+    storage.close_all()
+
+async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    METRICS.inc('errors_total', (('type', type(context.error).__name__),))
+    logging.error("Update %s failed", getattr(update, 'update_id', None), exc_info=context.error)
+
 async def global_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await start(update, context)
 
+def save_upload_sync(data: bytes, suffix: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    return path
+
+def import_results_file() -> None:
+    """(Re)import results.csv through the import pipeline whenever its content changed, unless an admin
+    upload is newer than the file. Each version of the file is tried once, whether or not it imports."""
+    try:
+        st = os.stat(RESULTS_FILE)
+    except FileNotFoundError:
+        return
+    seen = f"{st.st_mtime_ns}:{st.st_size}"
+    if get_meta_sync('results_csv_seen') == seen:
+        return
+    with open(RESULTS_FILE, 'rb') as f:
+        stamp = hashlib.sha256(f.read()).hexdigest()
+    set_meta_sync('results_csv_seen', seen)
+    if get_meta_sync('results_csv_stamp') == stamp:
+        return  # touched or checked out again, same content
+    set_meta_sync('results_csv_stamp', stamp)
+    uploaded = get_meta_sync('results_uploaded')
+    if uploaded is not None and uploaded >= st.st_mtime:
+        logging.warning("%s changed but is older than the last uploaded results; not imported", RESULTS_FILE)
+        return
+    import results_import
+    try:
+        report = results_import.import_results_sync(RESULTS_FILE, SUBJECTS)
+    except ValueError as e:
+        logging.error("%s not imported: %s", RESULTS_FILE, e)
+        return
+    logging.info("Imported %s: %d students, %d rejected, fuzzy columns %s, ignored %s",
+                 RESULTS_FILE, report['imported'], report['rejected'], report['fuzzy'], report['ignored'])
+
+def build_app(worker: Optional[int] = None, request=None) -> Application:
+    """The full bot; `worker` is the shard index when running under webhook.serve_sharded,
+    `request` replaces the HTTP layer (bench/loadtest.py passes a fake Bot API); either way it is timed"""
+    global WORKER_INDEX
+    WORKER_INDEX = worker
+    if worker is not None:
+        ANNOUNCEMENTS.max_age = SHARED_CACHE_TTL
+
+    builder = Application.builder().token(BOT_TOKEN).post_init(post_init).post_stop(post_stop).post_shutdown(post_shutdown)
+    persistence = make_persistence(PERSISTENCE, run_db, PERSIST_INTERVAL)
+    if persistence:
+        builder = builder.persistence(persistence)
+    builder = builder.request(metrics.InstrumentedRequest(request or HTTPXRequest(connection_pool_size=256), METRICS))
+    if request is not None:
+        builder = builder.get_updates_request(request)
+    app = builder.build()
+    app.add_handler(build_conv())
+    app.add_handler(CommandHandler('start', global_start))
+    app.add_error_handler(on_error)
+    metrics.instrument(app, METRICS)
+    return app
+
 def main() -> None:
-    init_dbs()
     if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
         logging.error("BOT_TOKEN not set in .env")
         return
-        
-    app = Application.builder().token(BOT_TOKEN).build()
-    app.add_handler(build_conv())
-    app.add_handler(CommandHandler('start', global_start))
-    app.add_error_handler(lambda u, c: logging.exception(c.error))
-    
-    if not os.path.exists('results.csv'):
-        with open('results.csv', 'w', newline='', encoding='utf-8') as f:
-            w = csv.writer(f)
-            w.writerow(['student_id', 'name', *SUBJECTS])
-            w.writerow(['STD001', 'Abel Tesfaye', '95', '88', '92', '90', '87'] + [''] * (len(SUBJECTS) - 5))
     
+    try:
+        make_persistence(PERSISTENCE, run_db, PERSIST_INTERVAL)  # refuse a bad config here, not in every worker
+    except (ValueError, ImportError) as e:
+        logging.error("PERSISTENCE=%s unusable: %s", PERSISTENCE, e)
+        return
+
+    if WEBHOOK_URL and WORKERS > 1:
+        # Migrate and import once here, so the workers' own warm-ups find nothing to do but load
+        init_db()
+        bootstrap_results()
+        import webhook
+        logging.info("Bot starting (webhook, %d workers)...", WORKERS)
+        webhook.serve_sharded(build_app, WORKERS, BOT_TOKEN, WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, secret=WEBHOOK_SECRET,
+                              concurrency=WEBHOOK_CONCURRENCY, max_queued=WEBHOOK_MAX_QUEUED)
+        return
+
+    app = build_app()
+    if WEBHOOK_URL:
+        import webhook
+        logging.info("Bot starting (webhook)...")
+        asyncio.run(webhook.serve(app, WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, secret=WEBHOOK_SECRET,
+                                  concurrency=WEBHOOK_CONCURRENCY, max_queued=WEBHOOK_MAX_QUEUED, metrics=METRICS))
+        return
+
     logging.info("Bot starting...")
     app.run_polling()
 
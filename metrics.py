@@ -0,0 +1,202 @@
+"""Prometheus-style metrics: counters and latency histograms in plain dicts, only touched on the event
+loop thread, rendered in the text exposition format for /metrics.
+
+`instrument()` wraps every handler callback of an Application (ConversationHandler states included),
+`InstrumentedRequest` wraps the Bot API HTTP layer, so both cost one perf_counter pair and a bisect.
+"""
+import asyncio, bisect, functools, logging, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telegram.ext import Application, BaseHandler, ConversationHandler
+from telegram.request import BaseRequest
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+class Registry:
+    """Counters/histograms keyed by (name, labels); `gauges()` adds a stats() dict sampled at render time"""
+    def __init__(self, prefix: str = 'bot'):
+        self.prefix = prefix
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.collectors: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        h = self.histograms.get((name, labels))
+        if h is None:
+            h = self.histograms[(name, labels)] = Histogram()
+        h.observe(value)
+
+    def gauges(self, name: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        self.collectors.append((name, stats))
+
+    #EXPOSITION
+    @staticmethod
+    def _labels(labels: Labels, extra: str = '') -> str:
+        parts = ['%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return '{%s}' % ','.join(parts) if parts else ''
+
+    def render(self) -> str:
+        out: List[str] = []
+        typed = set()
+
+        def head(name: str, kind: str) -> None:
+            if name not in typed:
+                typed.add(name)
+                out.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in sorted(self.counters.items()):
+            name = f'{self.prefix}_{name}'
+            head(name, 'counter')
+            out.append(f'{name}{self._labels(labels)} {value:g}')
+        for (name, labels), h in sorted(self.histograms.items()):
+            name = f'{self.prefix}_{name}'
+            head(name, 'histogram')
+            running = 0
+            for le, n in zip((*(f'{b:g}' for b in BUCKETS), '+Inf'), h.counts):
+                running += n
+                bucket = self._labels(labels, 'le="%s"' % le)
+                out.append(f'{name}_bucket{bucket} {running}')
+            out.append(f'{name}_sum{self._labels(labels)} {h.sum:.6f}')
+            out.append(f'{name}_count{self._labels(labels)} {running}')
+        for group, stats in self.collectors:
+            try:
+                values = stats()
+            except Exception:
+                logging.exception("metrics collector %s failed", group)
+                continue
+            for k, v in values.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    name = f'{self.prefix}_{group}_{k}'
+                    head(name, 'gauge')
+                    out.append(f'{name} {v:g}')
+        return '\n'.join(out) + '\n'
+
+#HANDLERS
+def _timed(registry: Registry, name: str, callback: Callable) -> Callable:
+    labels = (('handler', name),)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        t0 = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception as e:
+            registry.inc('handler_errors_total', (('handler', name), ('type', type(e).__name__)))
+            raise
+        finally:
+            registry.observe('handler_seconds', labels, time.perf_counter() - t0)
+    wrapper.__instrumented__ = True
+    return wrapper
+
+def _handlers(handler: BaseHandler):
+    if isinstance(handler, ConversationHandler):
+        for h in handler.entry_points:
+            yield from _handlers(h)
+        for hs in handler.states.values():
+            for h in hs:
+                yield from _handlers(h)
+        for h in handler.fallbacks:
+            yield from _handlers(h)
+    else:
+        yield handler
+
+def instrument(app: Application, registry: Registry) -> None:
+    """Time every registered handler callback, labelled by the callback's function name"""
+    wrapped: Dict[Callable, Callable] = {}
+    for group in app.handlers.values():
+        for top in group:
+            for h in _handlers(top):
+                cb = h.callback
+                if getattr(cb, '__instrumented__', False):
+                    continue  # the same handler object is registered under several states
+                if cb not in wrapped:
+                    wrapped[cb] = _timed(registry, getattr(cb, '__name__', 'callback'), cb)
+                h.callback = wrapped[cb]
+
+#BOT API
+class InstrumentedRequest(BaseRequest):
+    """Times every Bot API call by method name and counts non-200 answers and transport errors"""
+    def __init__(self, inner: BaseRequest, registry: Registry):
+        self.inner, self.registry = inner, registry
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.inner.read_timeout
+
+    async def initialize(self) -> None:
+        await self.inner.initialize()
+
+    async def shutdown(self) -> None:
+        await self.inner.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data=None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE, pool_timeout=BaseRequest.DEFAULT_NONE):
+        endpoint = url.rsplit('/', 1)[-1]
+        t0 = time.perf_counter()
+        try:
+            status, body = await self.inner.do_request(url, method, request_data=request_data, read_timeout=read_timeout,
+                                                       write_timeout=write_timeout, connect_timeout=connect_timeout,
+                                                       pool_timeout=pool_timeout)
+        except Exception as e:
+            self.registry.inc('api_errors_total', (('method', endpoint), ('type', type(e).__name__)))
+            raise
+        finally:
+            self.registry.observe('api_seconds', (('method', endpoint),), time.perf_counter() - t0)
+        if status != 200:
+            self.registry.inc('api_errors_total', (('method', endpoint), ('type', str(status))))
+        return status, body
+
+#SERVER
+class MetricsServer:
+    """Bare asyncio HTTP server answering GET /metrics (polling mode and sharded workers)"""
+    def __init__(self, registry: Registry):
+        self.registry = registry
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] == b'/metrics':
+                status, body = '200 OK', self.registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'not found\n'
+            writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str, port: int) -> None:
+        self._server = await asyncio.start_server(self._handle, host, port)
+        logging.info("Metrics on http://%s:%s/metrics", host, port)
+
+    async def stop(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
@@ -0,0 +1,104 @@
+"""Persistence for ConversationHandler states and user_data, shared by every bot worker.
+
+Updates are sharded by chat, so each chat is only ever live in one worker: memory is authoritative
+while the worker runs, and the backend lets the chat's flow survive that worker restarting.
+"""
+import json, os, pickle
+from abc import abstractmethod
+from typing import Any, Callable, Dict, Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+import storage
+
+class KeyedPersistence(BasePersistence):
+    """Maps PTB's persistence hooks onto a (kind, key) -> blob store; backends implement the three *_sync methods"""
+    def __init__(self, run: Callable, update_interval: float):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+                         update_interval=update_interval)
+        self._run = run  # async executor for the blocking backend calls (main.run_db)
+
+    @abstractmethod
+    def load_sync(self, kind: str) -> Dict[str, bytes]: ...
+    @abstractmethod
+    def save_sync(self, kind: str, key: str, blob: bytes) -> None: ...
+    @abstractmethod
+    def drop_sync(self, kind: str, key: str) -> None: ...
+
+    #USER DATA
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {int(k): pickle.loads(v) for k, v in (await self._run(self.load_sync, 'user_data')).items()}
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        await self._run(self.save_sync, 'user_data', str(user_id), pickle.dumps(data))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._run(self.drop_sync, 'user_data', str(user_id))
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        pass  # the owning worker's copy is always the newest
+
+    #CONVERSATIONS
+    async def get_conversations(self, name: str) -> Dict[tuple, object]:
+        rows = await self._run(self.load_sync, f'conv:{name}')
+        return {tuple(json.loads(k)): pickle.loads(v) for k, v in rows.items()}
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]) -> None:
+        if new_state is None:
+            await self._run(self.drop_sync, f'conv:{name}', json.dumps(list(key)))
+        else:
+            await self._run(self.save_sync, f'conv:{name}', json.dumps(list(key)), pickle.dumps(new_state))
+
+    #NOT STORED
+    async def get_chat_data(self) -> Dict[int, Any]: return {}
+    async def update_chat_data(self, chat_id: int, data: Any) -> None: pass
+    async def refresh_chat_data(self, chat_id: int, chat_data: Any) -> None: pass
+    async def drop_chat_data(self, chat_id: int) -> None: pass
+    async def get_bot_data(self) -> Dict[Any, Any]: return {}
+    async def update_bot_data(self, data: Any) -> None: pass
+    async def refresh_bot_data(self, bot_data: Any) -> None: pass
+    async def get_callback_data(self) -> None: return None
+    async def update_callback_data(self, data: Any) -> None: pass
+    async def flush(self) -> None: pass
+
+#BACKENDS
+class SqlitePersistence(KeyedPersistence):
+    """State rows live in bot.db next to everything else (WAL makes multi-process access safe)"""
+    def load_sync(self, kind: str) -> Dict[str, bytes]:
+        return storage.load_state_sync(kind)
+
+    def save_sync(self, kind: str, key: str, blob: bytes) -> None:
+        storage.save_state_sync(kind, key, blob)
+
+    def drop_sync(self, kind: str, key: str) -> None:
+        storage.drop_state_sync(kind, key)
+
+class RedisPersistence(KeyedPersistence):
+    """One Redis hash per kind, through redis-py's sync client"""
+    def __init__(self, client, run: Callable, update_interval: float, prefix: str = 'stanthony'):
+        super().__init__(run, update_interval)
+        self.client, self.prefix = client, prefix
+
+    def load_sync(self, kind: str) -> Dict[str, bytes]:
+        return {(k.decode() if isinstance(k, bytes) else k): v for k, v in self.client.hgetall(f'{self.prefix}:{kind}').items()}
+
+    def save_sync(self, kind: str, key: str, blob: bytes) -> None:
+        self.client.hset(f'{self.prefix}:{kind}', key, blob)
+
+    def drop_sync(self, kind: str, key: str) -> None:
+        self.client.hdel(f'{self.prefix}:{kind}', key)
+
+def make_persistence(backend: str, run: Callable, update_interval: float) -> Optional[BasePersistence]:
+    """backend: 'sqlite', 'redis' (needs REDIS_URL) or 'none'"""
+    if backend == 'sqlite':
+        return SqlitePersistence(run, update_interval)
+    if backend == 'redis':
+        url = os.getenv("REDIS_URL")
+        if not url:
+            # An in-process stand-in would be neither shared between workers nor kept across restarts
+            raise ValueError("PERSISTENCE=redis needs REDIS_URL (or use PERSISTENCE=sqlite)")
+        import redis  # optional dependency, only for PERSISTENCE=redis
+        return RedisPersistence(redis.Redis.from_url(url), run, update_interval)
+    if backend == 'none':
+        return None
+    raise ValueError(f"unknown PERSISTENCE={backend!r}; use sqlite, redis or none")
@@ -0,0 +1,152 @@
+"""Bulk results import: stream a CSV/XLSX sheet, map its headers onto SUBJECTS, validate every score and
+write the whole set, with totals and averages precomputed, into the results table (ranks are left to stats.py)."""
+import csv, difflib, json, os, re
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import storage
+
+FUZZY_CUTOFF = 0.8
+MAX_ERRORS_KEPT = 50
+ALIASES = {
+    'student_id': ('student id', 'studentid', 'id', 'student no', 'student number', 'roll no'),
+    'name': ('full name', 'student name', 'student'),
+    'class': ('section', 'grade', 'class section'),
+}
+CLASS_FROM_ID = re.compile(r'^\s*(\d{1,2})\s*([A-Za-z])')  # "9c5" -> class 9C
+
+def norm(text: str) -> str:
+    return ' '.join(re.sub(r'[_\-.]+', ' ', text or '').split()).lower()
+
+def key(st_id: str, name: str) -> Tuple[str, str]:
+    """Lookup key shared with the results index: whitespace-collapsed, case-insensitive"""
+    return (' '.join((st_id or '').split()).lower(), ' '.join((name or '').split()).lower())
+
+def class_of(st_id: str) -> str:
+    m = CLASS_FROM_ID.match(st_id or '')
+    return f"{m.group(1)}{m.group(2).upper()}" if m else ''
+
+#HEADERS
+def map_headers(headers: Sequence[str], subjects: Sequence[str]) -> Dict[str, Any]:
+    """Column index for every known field. Exact/alias matches are taken first, so a misspelt duplicate
+    of a column that also appears spelt correctly is ignored instead of overwriting it."""
+    targets = {norm(t): t for t in ('student_id', 'name', 'class', *subjects)}
+    for field, names in ALIASES.items():
+        for a in names:
+            targets.setdefault(norm(a), field)
+    columns: Dict[str, int] = {}
+    fuzzy: Dict[str, str] = {}
+    pending = []
+    for i, h in enumerate(headers):
+        t = targets.get(norm(h))
+        if t and t not in columns:
+            columns[t] = i
+        else:
+            pending.append((i, h))
+    ignored = []
+    for i, h in pending:
+        free = [n for n, t in targets.items() if t not in columns]
+        match = difflib.get_close_matches(norm(h), free, n=1, cutoff=FUZZY_CUTOFF)
+        if match:
+            columns[targets[match[0]]] = i
+            fuzzy[h] = targets[match[0]]
+        else:
+            ignored.append(h)
+    return {'columns': columns, 'fuzzy': fuzzy, 'ignored': ignored}
+
+#READERS
+def _read_csv(path: str) -> Iterator[List[str]]:
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        yield from csv.reader(f)
+
+def _read_xlsx(path: str) -> Iterator[List[str]]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("XLSX import needs openpyxl (pip install openpyxl); upload a CSV instead")
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(values_only=True):
+            yield ['' if v is None else str(v) for v in row]
+    finally:
+        wb.close()
+
+def read_rows(path: str) -> Iterator[List[str]]:
+    """Rows as strings; a file that cannot be parsed (corrupt zip, bad CSV quoting, ...) raises ValueError"""
+    rows = _read_xlsx(path) if os.path.splitext(path)[1].lower() in ('.xlsx', '.xlsm') else _read_csv(path)
+    try:
+        yield from rows
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"the file could not be read ({type(e).__name__}: {e})") from e
+
+#IMPORT
+def parse_score(raw: str) -> Optional[float]:
+    """None for an empty cell; ValueError for anything that is not a 0-100 score"""
+    raw = (raw or '').strip().replace('%', '')
+    if not raw:
+        return None
+    score = float(raw)
+    if not 0 <= score <= 100:
+        raise ValueError(f"{score:g} is outside 0-100")
+    return score
+
+def import_results_sync(path: str, subjects: Sequence[str]) -> Dict[str, Any]:
+    """Validate and load a results sheet, replacing the results table in one transaction.
+    Raises ValueError (nothing written) when the sheet is unusable."""
+    rows_in = read_rows(path)
+    headers = next(rows_in, None)
+    if not headers:
+        raise ValueError("the file is empty")
+    mapping = map_headers(headers, subjects)
+    cols = mapping['columns']
+    missing = [c for c in ('student_id', 'name') if c not in cols]
+    if missing:
+        raise ValueError(f"missing required column(s): {', '.join(missing)}")
+    subject_cols = [(s, cols[s]) for s in subjects if s in cols]
+
+    rows: List[Dict[str, Any]] = []
+    seen = set()
+    errors: List[str] = []
+    rejected = warnings = 0
+
+    def cell(values: List[str], i: int) -> str:
+        return values[i].strip() if i < len(values) else ''
+
+    for line, values in enumerate(rows_in, start=2):
+        if not any(v.strip() for v in values):
+            continue
+        st_id, name = cell(values, cols['student_id']), cell(values, cols['name'])
+        if not st_id or not name:
+            rejected += 1
+            if len(errors) < MAX_ERRORS_KEPT: errors.append(f"line {line}: missing student_id or name")
+            continue
+        k = key(st_id, name)
+        if k in seen:
+            rejected += 1
+            if len(errors) < MAX_ERRORS_KEPT: errors.append(f"line {line}: duplicate of an earlier row for {name} ({st_id})")
+            continue
+        seen.add(k)
+        subs = {}
+        for s, i in subject_cols:
+            try:
+                score = parse_score(cell(values, i))
+            except ValueError as e:
+                warnings += 1
+                if len(errors) < MAX_ERRORS_KEPT: errors.append(f"line {line}: {s} {e}, skipped")
+                continue
+            if score is not None:
+                subs[s] = score
+        total = round(sum(subs.values()), 2) if subs else 0
+        rows.append({
+            'id_key': k[0], 'name_key': k[1], 'student_id': st_id, 'name': name,
+            'class': cell(values, cols['class']) if 'class' in cols else class_of(st_id),
+            'subs': subs, 'total': total, 'avg': round(total / len(subs), 2) if subs else 0, 'count': len(subs),
+        })
+
+    storage.replace_results_sync([
+        (r['id_key'], r['name_key'], r['student_id'], r['name'], r['class'], json.dumps(r['subs']),
+         r['total'], r['avg'], r['count']) for r in rows])
+    return {'imported': len(rows), 'rejected': rejected, 'warnings': warnings, 'errors': errors,
+            'fuzzy': mapping['fuzzy'], 'ignored': mapping['ignored'],
+            'missing_subjects': [s for s in subjects if s not in cols]}
@@ -0,0 +1,56 @@
+"""Class and subject statistics over the results table, computed with NumPy in one pass per results version."""
+import warnings
+from typing import Any, Dict, Sequence
+
+import numpy as np
+
+PERCENTILES = (25, 50, 75)
+
+def _summary(block: np.ndarray, subjects: Sequence[str]) -> Dict[str, Dict[str, float]]:
+    """Per-subject mean/median/quartiles of a (students x subjects) block; NaN marks a missing score"""
+    counts = np.count_nonzero(~np.isnan(block), axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN columns: subject not taken by anyone here
+        means = np.nanmean(block, axis=0)
+        p25, median, p75 = np.nanpercentile(block, PERCENTILES, axis=0)
+    return {s: {'n': int(counts[j]), 'mean': round(float(means[j]), 2), 'median': round(float(median[j]), 2),
+                'p25': round(float(p25[j]), 2), 'p75': round(float(p75[j]), 2)}
+            for j, s in enumerate(subjects) if counts[j]}
+
+def _rank_within(totals: np.ndarray):
+    """Competition rank (1 = best) and mid-rank percentile (share scoring lower, ties counted half)"""
+    ordered = np.sort(totals)
+    below = np.searchsorted(ordered, totals, 'left')
+    upto = np.searchsorted(ordered, totals, 'right')
+    return len(totals) - upto + 1, 100.0 * (below + 0.5 * (upto - below)) / len(totals)
+
+def compute(table: Dict[tuple, Dict[str, Any]], subjects: Sequence[str]) -> Dict[str, Any]:
+    """table: results index entries ({'subs', 'total', 'class', ...}) keyed by (id_key, name_key)"""
+    keys = list(table)
+    if not keys:
+        return {'subjects': {}, 'classes': {}, 'students': {}}
+    col = {s: j for j, s in enumerate(subjects)}
+    scores = np.full((len(keys), len(subjects)), np.nan)
+    for i, k in enumerate(keys):
+        for s, v in table[k]['subs'].items():
+            scores[i, col[s]] = v
+    totals = np.fromiter((table[k]['total'] for k in keys), float, len(keys))
+    names, cls = np.unique([table[k]['class'] for k in keys], return_inverse=True)
+
+    rank, size, pct = np.empty(len(keys), int), np.empty(len(keys), int), np.empty(len(keys))
+    classes = {}
+    for c, name in enumerate(names):
+        m = cls == c
+        rank[m], pct[m] = _rank_within(totals[m])
+        size[m] = m.sum()
+        classes[str(name)] = {'size': int(m.sum()), 'mean_total': round(float(totals[m].mean()), 2),
+                              'subjects': _summary(scores[m], subjects)}
+    school_rank, school_pct = _rank_within(totals)
+
+    return {
+        'subjects': _summary(scores, subjects),
+        'classes': classes,
+        'students': {k: {'class_rank': int(rank[i]), 'class_size': int(size[i]), 'percentile': round(float(pct[i]), 1),
+                         'school_rank': int(school_rank[i]), 'school_percentile': round(float(school_pct[i]), 1)}
+                     for i, k in enumerate(keys)},
+    }
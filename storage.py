@@ -0,0 +1,354 @@
+import logging, os, sqlite3, threading, time
+from typing import Dict, List, Optional
+
+#CONFIG
+DB_PATH = os.getenv("BOT_DB", "bot.db")
+LEGACY_USERS_DB, LEGACY_POSTS_DB = 'users.db', 'posts.db'
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",      # readers never block the writer
+    "PRAGMA synchronous=NORMAL",    # fsync on checkpoint only; safe with WAL
+    "PRAGMA cache_size=-8000",      # 8 MB page cache per connection
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+#CONNECTIONS
+# One long-lived connection per thread (i.e. per executor worker). sqlite3 keeps a per-connection
+# statement cache, so the fixed SQL below is prepared once per thread instead of once per call.
+_local = threading.local()
+_all: List[sqlite3.Connection] = []
+_all_lock = threading.Lock()
+
+def conn() -> sqlite3.Connection:
+    c = getattr(_local, 'conn', None)
+    if c is None:
+        c = sqlite3.connect(DB_PATH, cached_statements=256, check_same_thread=False)
+        for p in PRAGMAS:
+            c.execute(p)
+        _local.conn = c
+        with _all_lock:
+            _all.append(c)
+    return c
+
+def close_all() -> None:
+    """Close every thread's connection; call only once the executor has shut down"""
+    with _all_lock:
+        for c in _all:
+            c.close()
+        _all.clear()
+    _local.__dict__.pop('conn', None)
+
+#SCHEMA
+def _import_legacy(c: sqlite3.Connection) -> None:
+    """Copy data from the old split users.db / posts.db files, keeping post and job ids"""
+    for alias, path, tables in (
+        ('legacy_users', LEGACY_USERS_DB, ('users',)),
+        ('legacy_posts', LEGACY_POSTS_DB, ('posts', 'broadcasts', 'deliveries')),
+    ):
+        if not os.path.exists(path):
+            continue
+        c.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        have = {r[0] for r in c.execute(f"SELECT name FROM {alias}.sqlite_master WHERE type = 'table'")}
+        for t in tables:
+            if t in have:
+                n = c.execute(f"INSERT OR IGNORE INTO main.{t} SELECT * FROM {alias}.{t}").rowcount
+                logging.info("Imported %d rows into %s from %s", n, t, path)
+        c.commit()
+        c.execute(f"DETACH DATABASE {alias}")
+
+def _posts_fts(c: sqlite3.Connection) -> None:
+    """External-content FTS5 index over posts, kept in sync by triggers (skipped if SQLite lacks FTS5)"""
+    try:
+        c.executescript('''
+            CREATE VIRTUAL TABLE posts_fts USING fts5(text, caption, content='posts', content_rowid='id',
+                                            tokenize='porter unicode61');
+            CREATE TRIGGER posts_fts_ai AFTER INSERT ON posts BEGIN
+                INSERT INTO posts_fts (rowid, text, caption) VALUES (new.id, new.text, new.caption);
+            END;
+            CREATE TRIGGER posts_fts_ad AFTER DELETE ON posts BEGIN
+                INSERT INTO posts_fts (posts_fts, rowid, text, caption) VALUES ('delete', old.id, old.text, old.caption);
+            END;
+            CREATE TRIGGER posts_fts_au AFTER UPDATE ON posts BEGIN
+                INSERT INTO posts_fts (posts_fts, rowid, text, caption) VALUES ('delete', old.id, old.text, old.caption);
+                INSERT INTO posts_fts (rowid, text, caption) VALUES (new.id, new.text, new.caption);
+            END;
+            INSERT INTO posts_fts (posts_fts) VALUES ('rebuild');''')
+    except sqlite3.OperationalError as e:
+        logging.warning("No full-text index for posts (%s); search falls back to LIKE", e)
+
+def _drop_result_ranks(c: sqlite3.Connection) -> None:
+    """Class ranks and sizes are computed by stats.py when the results are loaded, not stored"""
+    try:
+        c.execute("ALTER TABLE results DROP COLUMN class_rank")
+        c.execute("ALTER TABLE results DROP COLUMN class_size")
+    except sqlite3.OperationalError as e:
+        # DROP COLUMN needs SQLite 3.35; older ones keep the nullable columns, which are simply never written
+        logging.info("results rank columns kept (%s)", e)
+
+# MIGRATIONS[i] upgrades the schema from user_version i to i + 1; only ever append.
+MIGRATIONS = (
+    '''CREATE TABLE users (chat_id INTEGER PRIMARY KEY);
+       CREATE TABLE posts
+       (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER,
+        message_id INTEGER, text TEXT, caption TEXT, file_id TEXT);
+       CREATE TABLE broadcasts
+       (id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT, status TEXT NOT NULL DEFAULT 'running',
+        status_chat INTEGER, status_msg INTEGER, created REAL);
+       CREATE TABLE deliveries
+       (job_id INTEGER NOT NULL, chat_id INTEGER NOT NULL, status TEXT NOT NULL DEFAULT 'pending',
+        PRIMARY KEY (job_id, chat_id)) WITHOUT ROWID;
+       CREATE INDEX deliveries_status ON deliveries (job_id, status);''',
+    _import_legacy,
+    '''CREATE TABLE pending_deletes
+       (chat_id INTEGER NOT NULL, message_id INTEGER NOT NULL, deadline REAL NOT NULL,
+        PRIMARY KEY (chat_id, message_id)) WITHOUT ROWID;
+       CREATE INDEX pending_deletes_deadline ON pending_deletes (deadline);''',
+    '''CREATE TABLE conversation_state
+       (kind TEXT NOT NULL, key TEXT NOT NULL, data BLOB NOT NULL,
+        PRIMARY KEY (kind, key)) WITHOUT ROWID;''',
+    '''CREATE TABLE results
+       (id_key TEXT NOT NULL, name_key TEXT NOT NULL, student_id TEXT NOT NULL, name TEXT NOT NULL,
+        class TEXT NOT NULL DEFAULT '', scores TEXT NOT NULL, total REAL NOT NULL, avg REAL NOT NULL,
+        count INTEGER NOT NULL, class_rank INTEGER, class_size INTEGER,
+        PRIMARY KEY (id_key, name_key)) WITHOUT ROWID;
+       CREATE INDEX results_class ON results (class, total DESC);
+       CREATE TABLE meta (key TEXT PRIMARY KEY, value) WITHOUT ROWID;''',
+    _posts_fts,
+    '''CREATE TABLE tickets
+       (id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, username TEXT NOT NULL, name TEXT NOT NULL,
+        issue TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'open', created REAL NOT NULL, resolved REAL,
+        delivery TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0, next_try REAL NOT NULL DEFAULT 0);
+       CREATE INDEX tickets_due ON tickets (next_try) WHERE delivery = 'pending';
+       CREATE INDEX tickets_open ON tickets (id) WHERE status = 'open';''',
+    _drop_result_ranks,
+)
+
+def init_db() -> None:
+    c = conn()
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    for i, step in enumerate(MIGRATIONS[version:], start=version):
+        if callable(step):
+            step(c)
+        else:
+            c.executescript(step)
+        c.execute(f"PRAGMA user_version = {i + 1}")
+        c.commit()
+        logging.info("Database migrated to v%d", i + 1)
+
+#USERS
+def save_users_sync(chat_ids: List[int]):
+    with conn() as c:
+        c.executemany("INSERT OR IGNORE INTO users (chat_id) VALUES (?)", ((x,) for x in chat_ids))
+
+def get_all_users_sync() -> List[int]:
+    return [row[0] for row in conn().execute("SELECT chat_id FROM users")]
+
+def remove_users_sync(chat_ids: List[int]):
+    with conn() as c:
+        c.executemany("DELETE FROM users WHERE chat_id = ?", ((x,) for x in chat_ids))
+
+#POSTS
+def save_post_sync(chat_id: int, message_id: int, text: str, caption: str, file_id: str):
+    with conn() as c:
+        c.execute(
+            "INSERT INTO posts (chat_id, message_id, text, caption, file_id) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, message_id, text, caption, file_id))
+
+def fts_query(text: str) -> str:
+    """User words -> FTS5 query: every word must appear (stemmed, so "result" finds "results"). Each word is
+    quoted, so no operator injection; no prefix '*', as prefix scans cannot stop early at LIMIT."""
+    return ' '.join('"%s"' % w.replace('"', '""') for w in text.split())
+
+def _has_fts(c: sqlite3.Connection) -> bool:
+    return c.execute("SELECT 1 FROM sqlite_master WHERE name = 'posts_fts'").fetchone() is not None
+
+def _keyset_page(c: sqlite3.Connection, cols: str, src: str, where: List[str], args: List, key: str,
+                 limit: int, before: Optional[int], after: Optional[int]) -> tuple:
+    """(rows newest first, more older?, more newer?) for one page keyed on the integer column `key`"""
+    newer = after is not None
+    if newer:
+        where.append(f"{key} > ?"); args.append(after)
+    elif before is not None:
+        where.append(f"{key} < ?"); args.append(before)
+    sql = (f"SELECT {cols} FROM {src}" + (" WHERE " + " AND ".join(where) if where else "")
+           + f" ORDER BY {key} {'ASC' if newer else 'DESC'} LIMIT ?")
+    rows = c.execute(sql, (*args, limit + 1)).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if newer:
+        rows.reverse()
+    # Moving one way, the page we came from proves there is more in the other direction
+    return rows, (more if not newer else True), (more if newer else before is not None)
+
+def get_posts_page_sync(limit: int, before: Optional[int] = None, after: Optional[int] = None,
+                        query: Optional[str] = None) -> dict:
+    """One keyset page, newest first: posts older than `before`, or newer than `after`, or the newest.
+    Each page is a single range scan on posts.id (or on the FTS rowid when searching), whatever the table size."""
+    c = conn()
+    cols = "p.id, p.chat_id, p.message_id, p.text, p.caption, p.file_id"
+    key = "p.id"
+    if query and _has_fts(c):
+        # Range and order on the FTS rowid, so FTS5 walks its doclists backwards instead of sorting all matches
+        key = "posts_fts.rowid"
+        src, where, args = "posts_fts JOIN posts p ON p.id = posts_fts.rowid", ["posts_fts MATCH ?"], [fts_query(query)]
+    elif query:
+        like = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        src, where, args = "posts p", ["(p.text LIKE ? ESCAPE '\\' OR p.caption LIKE ? ESCAPE '\\')"], [like, like]
+    else:
+        src, where, args = "posts p", [], []
+    rows, older, newer = _keyset_page(c, cols, src, where, args, key, limit, before, after)
+    posts = [{'id': r[0], 'chat_id': r[1], 'message_id': r[2], 'text': r[3], 'caption': r[4], 'file_id': r[5]} for r in rows]
+    return {'posts': posts, 'older': older, 'newer': newer}
+
+def delete_post_by_id_sync(post_id: int):
+    with conn() as c:
+        c.execute("DELETE FROM posts WHERE id = ?", (post_id,))
+
+def update_post_text_sync(post_id: int, text: str):
+    with conn() as c:
+        c.execute("UPDATE posts SET text = ?, caption = '' WHERE id = ?", (text, post_id))
+
+#BROADCAST JOBS
+# Delivery status: pending -> claimed (by a worker, in batches) -> sending (that one send is under way) -> sent | failed | blocked.
+# After a restart claimed rows go back to pending; rows still 'sending' may or may not have gone out, so they
+# become 'unknown' and are never resent.
+def create_broadcast_sync(text: str, chat_ids: List[int], status_chat: int, status_msg: int) -> int:
+    with conn() as c:
+        job_id = c.execute(
+            "INSERT INTO broadcasts (text, status_chat, status_msg, created) VALUES (?, ?, ?, ?)",
+            (text, status_chat, status_msg, time.time())).lastrowid
+        c.executemany("INSERT OR IGNORE INTO deliveries (job_id, chat_id) VALUES (?, ?)", ((job_id, x) for x in chat_ids))
+        return job_id
+
+def get_broadcast_sync(job_id: int) -> Optional[dict]:
+    r = conn().execute("SELECT id, text, status, status_chat, status_msg FROM broadcasts WHERE id = ?", (job_id,)).fetchone()
+    return {'id': r[0], 'text': r[1], 'status': r[2], 'status_chat': r[3], 'status_msg': r[4]} if r else None
+
+def get_running_broadcasts_sync() -> List[int]:
+    """Running job ids; claimed-but-untried deliveries are requeued, those interrupted mid-send written off as 'unknown'"""
+    with conn() as c:
+        c.execute("UPDATE deliveries SET status = 'pending' WHERE status = 'claimed'")
+        c.execute("UPDATE deliveries SET status = 'unknown' WHERE status = 'sending'")
+        return [r[0] for r in c.execute("SELECT id FROM broadcasts WHERE status = 'running' ORDER BY id")]
+
+def claim_deliveries_sync(job_id: int, limit: int) -> List[int]:
+    # One UPDATE ... RETURNING, so workers in other processes can never claim the same rows
+    with conn() as c:
+        return [r[0] for r in c.execute(
+            """UPDATE deliveries SET status = 'claimed' WHERE job_id = ? AND chat_id IN
+               (SELECT chat_id FROM deliveries WHERE job_id = ? AND status = 'pending' LIMIT ?) RETURNING chat_id""",
+            (job_id, job_id, limit)).fetchall()]
+
+def mark_deliveries_sync(job_id: int, outcomes: List[tuple]):
+    with conn() as c:
+        c.executemany("UPDATE deliveries SET status = ? WHERE job_id = ? AND chat_id = ?", ((st, job_id, x) for st, x in outcomes))
+
+def broadcast_counts_sync(job_id: int) -> Dict[str, int]:
+    return dict(conn().execute("SELECT status, COUNT(*) FROM deliveries WHERE job_id = ? GROUP BY status", (job_id,)).fetchall())
+
+def finish_broadcast_sync(job_id: int) -> List[int]:
+    """Mark the job done and return the chats that turned out to be blocked"""
+    with conn() as c:
+        c.execute("UPDATE broadcasts SET status = 'done' WHERE id = ?", (job_id,))
+        return [r[0] for r in c.execute("SELECT chat_id FROM deliveries WHERE job_id = ? AND status = 'blocked'", (job_id,))]
+
+#PENDING DELETES
+def add_pending_deletes_sync(rows: List[tuple]):
+    """rows: (chat_id, message_id, deadline)"""
+    with conn() as c:
+        c.executemany("INSERT OR REPLACE INTO pending_deletes (chat_id, message_id, deadline) VALUES (?, ?, ?)", rows)
+
+def forget_pending_deletes_sync(targets: List[tuple]):
+    with conn() as c:
+        c.executemany("DELETE FROM pending_deletes WHERE chat_id = ? AND message_id = ?", targets)
+
+def pop_due_deletes_sync(now: float, limit: int) -> List[tuple]:
+    """Remove and return up to `limit` overdue (chat_id, message_id) pairs, oldest deadline first"""
+    with conn() as c:
+        return c.execute(
+            """DELETE FROM pending_deletes WHERE (chat_id, message_id) IN
+               (SELECT chat_id, message_id FROM pending_deletes WHERE deadline <= ? ORDER BY deadline LIMIT ?)
+               RETURNING chat_id, message_id""", (now, limit)).fetchall()
+
+#SUPPORT TICKETS
+# status: open -> resolved (admin). delivery to the IT chat: pending -> sent | failed (out of retries).
+TICKET_COLS = "id, chat_id, username, name, issue, status, created, delivery, attempts"
+
+def _ticket(r: tuple) -> dict:
+    return {'id': r[0], 'chat_id': r[1], 'username': r[2], 'name': r[3], 'issue': r[4], 'status': r[5],
+            'created': r[6], 'delivery': r[7], 'attempts': r[8]}
+
+def create_ticket_sync(chat_id: int, username: str, name: str, issue: str) -> int:
+    with conn() as c:
+        return c.execute("INSERT INTO tickets (chat_id, username, name, issue, created) VALUES (?, ?, ?, ?, ?)",
+                         (chat_id, username, name, issue, time.time())).lastrowid
+
+def due_tickets_sync(now: float, limit: int) -> List[dict]:
+    """Undelivered tickets whose next attempt is due, oldest first"""
+    return [_ticket(r) for r in conn().execute(
+        f"SELECT {TICKET_COLS} FROM tickets WHERE delivery = 'pending' AND next_try <= ? ORDER BY id LIMIT ?", (now, limit))]
+
+def mark_tickets_sync(rows: List[tuple]):
+    """rows: (delivery, attempts, next_try, ticket_id)"""
+    with conn() as c:
+        c.executemany("UPDATE tickets SET delivery = ?, attempts = ?, next_try = ? WHERE id = ?", rows)
+
+def get_tickets_page_sync(limit: int, before: Optional[int] = None, after: Optional[int] = None) -> dict:
+    """Open tickets, newest first, keyset-paginated on id like the announcement archive"""
+    rows, older, newer = _keyset_page(conn(), TICKET_COLS, "tickets", ["status = 'open'"], [], "id", limit, before, after)
+    return {'tickets': [_ticket(r) for r in rows], 'older': older, 'newer': newer}
+
+def resolve_ticket_sync(ticket_id: int) -> Optional[int]:
+    """Close an open ticket; returns the student's chat id, or None if it was not open"""
+    with conn() as c:
+        r = c.execute("UPDATE tickets SET status = 'resolved', resolved = ? WHERE id = ? AND status = 'open' RETURNING chat_id",
+                      (time.time(), ticket_id)).fetchone()
+        return r[0] if r else None
+
+def ticket_counts_sync() -> Dict[str, int]:
+    """Open/resolved totals plus open tickets still waiting for delivery or out of retries"""
+    c = conn()
+    counts = dict(c.execute("SELECT status, COUNT(*) FROM tickets GROUP BY status").fetchall())
+    counts.update(c.execute("SELECT delivery, COUNT(*) FROM tickets WHERE status = 'open' AND delivery != 'sent' GROUP BY delivery").fetchall())
+    return counts
+
+#CONVERSATION STATE
+def load_state_sync(kind: str) -> Dict[str, bytes]:
+    return dict(conn().execute("SELECT key, data FROM conversation_state WHERE kind = ?", (kind,)).fetchall())
+
+def save_state_sync(kind: str, key: str, blob: bytes):
+    with conn() as c:
+        c.execute("INSERT OR REPLACE INTO conversation_state (kind, key, data) VALUES (?, ?, ?)", (kind, key, blob))
+
+def drop_state_sync(kind: str, key: str):
+    with conn() as c:
+        c.execute("DELETE FROM conversation_state WHERE kind = ? AND key = ?", (kind, key))
+
+#META
+def get_meta_sync(key: str):
+    r = conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return r[0] if r else None
+
+def set_meta_sync(key: str, value):
+    with conn() as c:
+        c.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+#RESULTS
+def replace_results_sync(rows: List[tuple]):
+    """Swap in a complete results set atomically and bump results_version"""
+    with conn() as c:
+        c.execute("DELETE FROM results")
+        c.executemany(
+            """INSERT INTO results (id_key, name_key, student_id, name, class, scores, total, avg, count)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+        c.execute("""INSERT INTO meta (key, value) VALUES ('results_version', 1)
+                     ON CONFLICT (key) DO UPDATE SET value = value + 1""")
+
+def results_version_sync() -> int:
+    return get_meta_sync('results_version') or 0
+
+def load_results_sync() -> List[tuple]:
+    return conn().execute(
+        "SELECT id_key, name_key, student_id, name, class, scores, total, avg, count FROM results"
+    ).fetchall()
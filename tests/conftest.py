@@ -0,0 +1,13 @@
+import importlib
+
+import pytest
+
+@pytest.fixture
+def fresh_main(tmp_path, monkeypatch):
+    """main reloaded inside tmp_path: its executor and warm-up are module singletons that an earlier
+    test's post_shutdown has already torn down"""
+    monkeypatch.chdir(tmp_path)
+    import main
+    importlib.reload(main)
+    monkeypatch.setattr(main, 'RECENT_COUNT', 5)  # still a placeholder in main.py
+    return main
@@ -0,0 +1,41 @@
+"""Buttons on messages older than 48 hours arrive with an InaccessibleMessage (date 0, no text);
+pressing them must still work."""
+import asyncio, logging, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+
+import loadtest as lt
+
+def old_menu(data: dict, bot):
+    """The callback update, with its message replaced by the InaccessibleMessage Telegram sends for old menus"""
+    from telegram import CallbackQuery, Chat, InaccessibleMessage, Update
+    q = data['callback_query']
+    msg = InaccessibleMessage(Chat(q['message']['chat']['id'], 'private'), q['message']['message_id'])
+    query = CallbackQuery(q['id'], Update.de_json(data, bot).callback_query.from_user, q['chat_instance'],
+                          message=msg, data=q['data'])
+    for obj in (msg, msg.chat, query):
+        obj.set_bot(bot)
+    return Update(data['update_id'], callback_query=query)
+
+async def press_old_buttons(main) -> lt.FakeBotAPI:
+    from telegram import Update
+    main.init_db()
+    api = lt.FakeBotAPI(latency=0)
+    app = main.build_app(request=api)
+    await app.initialize()
+    await app.post_init(app)
+
+    uid = 1001
+    await app.process_update(Update.de_json(lt.text_update(uid, '/start'), app.bot))
+    for data in ('check_join', 'about_school', 'back'):
+        await app.process_update(old_menu(lt.callback_update(uid, data, api), app.bot))
+    await app.shutdown()
+    await app.post_shutdown(app)
+    return api
+
+def test_buttons_on_inaccessible_messages(fresh_main, caplog):
+    api = asyncio.run(press_old_buttons(fresh_main))
+    failed = [r.getMessage() for r in caplog.records if r.exc_info or r.levelno >= logging.ERROR]
+    assert not failed, failed
+    assert api.calls['answerCallbackQuery'] >= 3
+    assert api.calls['sendMessage'] >= 3, "an old menu cannot be edited, so each press sends a new one"
@@ -0,0 +1,61 @@
+"""Handlers must never block the event loop: drive the real Application against the fake Bot API from
+bench/loadtest.py with asyncio debug mode on, and fail on any "Executing ... took" slow-callback warning."""
+import asyncio, logging, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+
+import loadtest as lt
+
+async def drive(main) -> None:
+    from telegram import Update
+    main.init_db()
+    lt.seed_results(main, 200)
+    api = lt.FakeBotAPI(latency=0)
+    api.files['sheet'] = ('student_id,name,' + ','.join(main.SUBJECTS[:3]) + '\n9a1,Abel Tesfaye,90,80,70\n').encode()
+    app = main.build_app(request=api)
+    await app.initialize()
+    await app.post_init(app)
+    await asyncio.sleep(0)  # post_init turned debug mode on; it covers every step that starts from here
+
+    async def send(data: dict) -> None:
+        await app.process_update(Update.de_json(data, app.bot))
+
+    uid, admin = 1001, 42
+    await send(lt.text_update(uid, '/start'))
+    for data in ('check_join', 'results'):
+        await send(lt.callback_update(uid, data, api))
+    await send(lt.text_update(uid, 'Student Number3'))
+    await send(lt.text_update(uid, '12a3'))
+    for data in ('announcements', 'ann_search'):
+        await send(lt.callback_update(uid, data, api))
+    await send(lt.text_update(uid, 'exam'))
+    for data in ('back', 'support'):
+        await send(lt.callback_update(uid, data, api))
+    await send(lt.text_update(uid, 'I cannot see my results'))
+    await send(lt.text_update(uid, 'Student Number3'))
+
+    await send(lt.text_update(admin, '/admin'))
+    await send(lt.text_update(admin, main.ADMIN_PASS))
+    await send(lt.callback_update(admin, 'post', api))
+    await send(lt.text_update(admin, 'Exam results are out!'))
+    await send(lt.callback_update(admin, 'import_results', api))
+    await send(lt.document_update(admin, 'results.csv', 'sheet'))
+    for data in ('stats', 'tickets', 'edit_post'):
+        await send(lt.callback_update(admin, data, api))
+
+    while await main.run_db(main.get_running_broadcasts_sync):
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.2)  # background deletes and write-behind flushes
+    await app.shutdown()
+    await app.post_shutdown(app)
+
+def test_handlers_do_not_block_the_loop(fresh_main, monkeypatch, caplog):
+    main = fresh_main
+    monkeypatch.setattr(main, 'LOOP_DEBUG', True)
+    caplog.set_level(logging.WARNING, logger='asyncio')
+    asyncio.run(drive(main))
+    failed = [r.getMessage() for r in caplog.records if r.exc_info]
+    assert not failed, failed
+    assert main.RESULTS.lookup('Abel Tesfaye', '9a1'), "the uploaded sheet was not imported"
+    slow = [r.getMessage() for r in caplog.records if r.name == 'asyncio' and r.getMessage().startswith('Executing')]
+    assert not slow, "blocking work on the event loop:\n" + "\n".join(slow)
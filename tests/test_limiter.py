@@ -0,0 +1,88 @@
+"""AttemptLimiter on a fake clock, and the results lookup handler in front of it."""
+import asyncio, types
+
+import pytest
+
+import main
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(main, 'time', types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+def limiter(**kw) -> main.AttemptLimiter:
+    args = dict(rate=0.2, burst=5, global_rate=200, free_failures=2, lockout_base=30, lockout_max=3600)
+    return main.AttemptLimiter(**{**args, **kw})
+
+def test_flood_is_rejected_after_the_burst(clock):
+    lim = limiter()
+    assert [lim.check(1) for _ in range(5)] == [0.0] * 5
+    assert all(lim.check(1) > 0 for _ in range(100))
+    assert lim.check(2) == 0.0, "other chats keep their own bucket"
+    clock[0] += 5  # rate 0.2/s: one token back
+    assert lim.check(1) == 0.0 and lim.check(1) > 0
+    assert lim.stats()['allowed'] == 7
+
+def test_lockout_doubles_and_success_clears_it(clock):
+    lim = limiter(burst=100, rate=100)
+    lockouts = []
+    for _ in range(5):
+        clock[0] += lockouts[-1] if lockouts else 0
+        assert lim.check(1) == 0.0
+        lim.failure(1)
+        lockouts.append(lim.check(1))
+    assert lockouts[:2] == [0.0, 0.0], "free failures do not lock"
+    assert lockouts[2:] == [30.0, 60.0, 120.0]
+    clock[0] += 120
+    lim.success(1)
+    lim.failure(1)
+    assert lim.check(1) == 0.0, "success resets the failure count"
+
+def test_prune_forgets_long_expired_lockouts(clock):
+    lim = limiter(max_entries=100, burst=100, rate=100)
+    for chat in range(100):
+        lim.check(chat)
+        for _ in range(3):
+            lim.failure(chat)
+    clock[0] += 3600 + 30
+    lim.check(1000)
+    assert lim.stats()['tracked'] == 1
+    for chat in range(100, 300):  # all still locked: the oldest are dropped in bulk instead
+        lim.check(chat)
+        for _ in range(3):
+            lim.failure(chat)
+        assert lim.stats()['tracked'] <= 100
+
+def test_rejected_guesses_never_reach_the_database(monkeypatch):
+    calls, replies = [], []
+
+    async def run_db(func, *args, **kw):
+        calls.append(func)
+
+    async def clean_and_send(update, context, text, markup=None):
+        replies.append(text)
+
+    async def noop(*args, **kw):
+        pass
+
+    lim = limiter(free_failures=5)
+    monkeypatch.setattr(main, 'RESULTS_LIMITER', lim)
+    for name, value in (('run_db', run_db), ('clean_and_send', clean_and_send), ('safe_delete', noop),
+                        ('track_result', lambda *a: None)):
+        monkeypatch.setattr(main, name, value)
+    monkeypatch.setattr(main.WARMUP, 'wait', noop)
+
+    async def reply_text(text, **kw):
+        return types.SimpleNamespace(message_id=1, chat_id=7)
+    message = types.SimpleNamespace(chat_id=7, message_id=1, text='x', reply_text=reply_text)
+    update = types.SimpleNamespace(message=message, effective_chat=types.SimpleNamespace(id=7))
+    context = types.SimpleNamespace(user_data={'name': 'Nobody'}, bot=None)
+
+    async def flood():
+        for _ in range(50):
+            assert await main.results_id(update, context) == main.STUDENT_MENU
+    asyncio.run(flood())
+    assert calls == [main.get_student_results] * 5
+    assert replies.count("❌ No results found. Check name/ID.") == 5
+    assert sum(r.startswith("⏳ Too many attempts") for r in replies) == 45
@@ -0,0 +1,43 @@
+"""Background loops must stop promptly at shutdown, even when a cancel() gets swallowed mid-round."""
+import asyncio, time
+
+import main
+
+def test_idle_loops_stop_at_once():
+    async def go():
+        loops = [main.KnownUsers(), main.PendingDeletes(), main.ExpiryScheduler(lambda app, key: None),
+                 main.SupportDispatcher()]
+        for lp, start in zip(loops, ((), (None,), (None,), (None,))):
+            lp.flush = lp.sweep = lp.dispatch = noop  # no DB behind these
+            lp.start(*start)
+        await asyncio.sleep(0.05)
+        t = time.monotonic()
+        for lp in loops:
+            await lp.stop()
+        return time.monotonic() - t
+
+    async def noop(*args):
+        return 0
+    assert asyncio.run(go()) < 0.5
+
+def test_stuck_round_that_swallows_cancel(monkeypatch):
+    monkeypatch.setattr(main, 'STOP_GRACE', 0.1)
+    rounds = []
+
+    async def dispatch(bot):
+        rounds.append(1)
+        if len(rounds) == 1:
+            try: await asyncio.sleep(3600)
+            except asyncio.CancelledError: pass  # what wait_for can do on Python 3.11
+        return 0
+
+    async def go():
+        support = main.SupportDispatcher()
+        support.dispatch = dispatch
+        support.start(None)
+        await asyncio.sleep(0.01)
+        t = time.monotonic()
+        await asyncio.wait_for(support.stop(), 2)
+        return time.monotonic() - t
+    assert asyncio.run(go()) < 1
+    assert rounds == [1], "the stop event ends the loop after the swallowed cancel"
@@ -0,0 +1,67 @@
+"""WebhookApp over httpx's ASGI transport, with a stub Application recording what it processed."""
+import asyncio, os, random, sys
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import webhook
+
+class StubApp:
+    bot = None
+
+    def __init__(self):
+        self.seen, self.gate = [], None
+
+    async def process_update(self, update) -> None:
+        if self.gate:
+            await self.gate.wait()
+        await asyncio.sleep(random.random() / 100)
+        self.seen.append((update.effective_chat.id, update.message.text))
+
+def message(update_id: int, chat_id: int, text: str) -> dict:
+    return {'update_id': update_id, 'message': {'message_id': update_id, 'date': 0, 'text': text,
+                                                'chat': {'id': chat_id, 'type': 'private'}}}
+
+def client(sink, **kw) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=webhook.WebhookApp(sink, **kw)), base_url='http://bot')
+
+def test_routes_and_rejections():
+    async def go():
+        app = StubApp()
+        dispatcher = webhook.ChatDispatcher(app, concurrency=4, max_queued=1)
+        async with client(dispatcher, secret='s3') as c:
+            r = await c.get('/health')
+            assert r.status_code == 200 and r.json()['status'] == 'ok'
+            assert (await c.get('/nope')).status_code == 404
+            assert (await c.get('/webhook')).status_code == 405
+            assert (await c.post('/webhook', json=message(1, 7, 'hi'))).status_code == 403
+            bad, ok = {'x-telegram-bot-api-secret-token': 'no'}, {'x-telegram-bot-api-secret-token': 's3'}
+            assert (await c.post('/webhook', json=message(1, 7, 'hi'), headers=bad)).status_code == 403
+            assert (await c.post('/webhook', content=b'{not json', headers=ok)).status_code == 400
+            assert (await c.post('/webhook', content=b'x' * (webhook.MAX_BODY + 1), headers=ok)).status_code == 413
+
+            app.gate = asyncio.Event()
+            assert (await c.post('/webhook', json=message(2, 7, 'a'), headers=ok)).status_code == 200
+            await asyncio.sleep(0)  # the drain task picks it up, so the queue is empty again
+            assert (await c.post('/webhook', json=message(3, 7, 'b'), headers=ok)).status_code == 200
+            r = await c.post('/webhook', json=message(4, 7, 'c'), headers=ok)
+            assert r.status_code == 503 and r.json() == {'error': 'busy'}
+            app.gate.set()
+            await dispatcher.drain()
+        assert app.seen == [(7, 'a'), (7, 'b')]
+    asyncio.run(go())
+
+def test_updates_for_one_chat_keep_their_order():
+    async def go():
+        app = StubApp()
+        dispatcher = webhook.ChatDispatcher(app, concurrency=8, max_queued=1000)
+        sent = [(chat, str(i)) for i in range(30) for chat in (1, 2, 3)]
+        async with client(dispatcher) as c:
+            for n, (chat, text) in enumerate(sent):
+                assert (await c.post('/webhook', json=message(n, chat, text))).status_code == 200
+            await dispatcher.drain()
+        for chat in (1, 2, 3):
+            assert [t for ch, t in app.seen if ch == chat] == [t for ch, t in sent if ch == chat]
+        assert dispatcher.stats()['processed'] == len(sent)
+    asyncio.run(go())
@@ -0,0 +1,259 @@
+"""Webhook mode: a small ASGI app that feeds Telegram updates into the Application.
+
+Updates are processed concurrently up to a limit, but updates for the same chat run strictly in
+arrival order, so ConversationHandler states never race. Run it with `serve()` (uvicorn), or drive
+`WebhookApp` from any ASGI client to post fake Update JSON locally. `serve_sharded()` runs N worker
+processes instead and routes each chat to a fixed worker.
+"""
+import asyncio, json, logging, multiprocessing, queue
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from telegram import Bot, Update
+from telegram.ext import Application
+
+MAX_BODY = 256 * 1024  # bytes; a Telegram update is a few KB, anything far bigger is not one
+
+#DISPATCH
+class ChatDispatcher:
+    """Per-chat FIFO queues drained by one task per busy chat, with a global concurrency cap"""
+    def __init__(self, app: Application, concurrency: int, max_queued: int):
+        self.app, self.max_queued = app, max_queued
+        self._sem = asyncio.Semaphore(concurrency)
+        self._queues: Dict[Any, Deque[Update]] = {}
+        self._tasks: set = set()
+        self.queued = self.inflight = self.processed = self.errors = 0
+
+    @staticmethod
+    def key(update: Update) -> Any:
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return ('user', update.effective_user.id)
+        return ('update', update.update_id)
+
+    def submit_json(self, data: dict) -> bool:
+        return self.submit(Update.de_json(data, self.app.bot))
+
+    def submit(self, update: Update) -> bool:
+        """Queue an update; False means we are over capacity and Telegram should retry later"""
+        if self.queued >= self.max_queued:
+            return False
+        key = self.key(update)
+        self.queued += 1
+        q = self._queues.get(key)
+        if q is not None:
+            q.append(update)
+            return True
+        self._queues[key] = deque((update,))
+        task = asyncio.create_task(self._drain(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _drain(self, key) -> None:
+        q = self._queues[key]
+        while q:
+            update = q.popleft()
+            self.queued -= 1
+            async with self._sem:
+                self.inflight += 1
+                try:
+                    await self.app.process_update(update)
+                    self.processed += 1
+                except Exception:
+                    self.errors += 1
+                    logging.exception("processing update %s failed", update.update_id)
+                finally:
+                    self.inflight -= 1
+        # Nothing can be appended between the empty check and this pop: no await in between
+        del self._queues[key]
+
+    async def drain(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {'queued': self.queued, 'inflight': self.inflight, 'chats': len(self._queues),
+                'processed': self.processed, 'errors': self.errors}
+
+#SHARDING
+def shard_key(data: dict) -> Optional[int]:
+    """Chat id of a raw update (user id when there is no chat), matching ChatDispatcher.key"""
+    for field, obj in data.items():
+        if not isinstance(obj, dict):
+            continue
+        chat = obj.get('chat') or (obj.get('message') or {}).get('chat')
+        if chat and 'id' in chat:
+            return chat['id']
+        user = obj.get('from') or obj.get('user')
+        if user and 'id' in user:
+            return user['id']
+    return None
+
+class ShardRouter:
+    """Front-process sink: forwards raw update JSON to the worker that owns the chat"""
+    def __init__(self, queues: List[Any]):
+        self.queues = queues
+        self.routed = self.rejected = 0
+
+    def submit_json(self, data: dict) -> bool:
+        key = shard_key(data)
+        q = self.queues[(key if key is not None else data.get('update_id', 0)) % len(self.queues)]
+        try:
+            q.put_nowait(data)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        self.routed += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {'workers': len(self.queues), 'routed': self.routed, 'rejected': self.rejected}
+
+#ASGI
+class WebhookApp:
+    """`sink` is a ChatDispatcher (single process) or a ShardRouter (front of serve_sharded);
+    `metrics` is a metrics.Registry served on GET /metrics"""
+    def __init__(self, sink, path: str = '/webhook', secret: Optional[str] = None, metrics=None):
+        self.sink, self.path, self.secret, self.metrics = sink, path, secret, metrics
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            return
+        method, path = scope['method'], scope['path']
+        if path == '/health' and method == 'GET':
+            return await self._respond(send, 200, {'status': 'ok', **self.sink.stats()})
+        if path == '/metrics' and method == 'GET' and self.metrics is not None:
+            return await self._send(send, 200, self.metrics.render().encode(), b'text/plain; version=0.0.4; charset=utf-8')
+        if path != self.path:
+            return await self._respond(send, 404, {'error': 'not found'})
+        if method != 'POST':
+            return await self._respond(send, 405, {'error': 'method not allowed'})
+        headers = dict(scope.get('headers') or [])
+        if self.secret and headers.get(b'x-telegram-bot-api-secret-token', b'').decode() != self.secret:
+            return await self._respond(send, 403, {'error': 'bad secret'})
+
+        try: declared = int(headers.get(b'content-length', 0))
+        except ValueError: declared = 0
+        if declared > MAX_BODY:
+            return await self._respond(send, 413, {'error': 'too large'})
+        body = b''
+        while True:
+            msg = await receive()
+            body += msg.get('body', b'')
+            if len(body) > MAX_BODY:
+                return await self._respond(send, 413, {'error': 'too large'})
+            if not msg.get('more_body'):
+                break
+        try:
+            data = json.loads(body)
+            accepted = self.sink.submit_json(data)
+        except Exception:
+            return await self._respond(send, 400, {'error': 'bad update'})
+        if not accepted:
+            return await self._respond(send, 503, {'error': 'busy'})
+        await self._respond(send, 200, {'ok': True})
+
+    @classmethod
+    async def _respond(cls, send, status: int, payload: dict) -> None:
+        await cls._send(send, status, json.dumps(payload).encode(), b'application/json')
+
+    @staticmethod
+    async def _send(send, status: int, body: bytes, content_type: bytes) -> None:
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+#SERVER
+async def _start(app: Application) -> None:
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+
+async def _stop(app: Application, dispatcher: ChatDispatcher) -> None:
+    await dispatcher.drain()
+    await app.stop()
+    if app.post_stop:
+        await app.post_stop(app)
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+
+def _server(sink, host: str, port: int, path: str, secret: Optional[str], metrics=None):
+    import uvicorn  # only needed in webhook mode
+    return uvicorn.Server(uvicorn.Config(WebhookApp(sink, path, secret, metrics), host=host, port=port,
+                                         lifespan='off', log_level='warning'))
+
+async def serve(app: Application, url: str, host: str, port: int, path: str = '/webhook',
+                secret: Optional[str] = None, concurrency: int = 64, max_queued: int = 10000, metrics=None) -> None:
+    """Run the Application behind uvicorn until interrupted (replaces run_polling)"""
+    dispatcher = ChatDispatcher(app, concurrency, max_queued)
+    if metrics is not None:
+        metrics.gauges('webhook', dispatcher.stats)
+    await _start(app)
+    await app.bot.set_webhook(url=url.rstrip('/') + path, secret_token=secret,
+                              allowed_updates=Update.ALL_TYPES, max_connections=min(100, concurrency))
+    logging.info("Webhook listening on %s:%s%s", host, port, path)
+    try:
+        await _server(dispatcher, host, port, path, secret, metrics).serve()
+    finally:
+        await _stop(app, dispatcher)
+
+#WORKERS
+def _worker(make_app: Callable[[int], Application], index: int, inbox, concurrency: int, max_queued: int) -> None:
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - worker{index} - %(levelname)s - %(message)s')
+    asyncio.run(_worker_loop(make_app(index), inbox, concurrency, max_queued))
+
+async def _worker_loop(app: Application, inbox, concurrency: int, max_queued: int) -> None:
+    dispatcher = ChatDispatcher(app, concurrency, max_queued)
+    await _start(app)
+    loop = asyncio.get_running_loop()
+    try:
+        while (data := await loop.run_in_executor(None, inbox.get)) is not None:
+            while dispatcher.queued >= max_queued:
+                await asyncio.sleep(0.01)
+            try: dispatcher.submit_json(data)
+            except Exception: logging.exception("bad update from front")
+    finally:
+        await _stop(app, dispatcher)
+
+async def _supervise(procs: List[Any], spawn: Callable[[int], Any]) -> None:
+    """Restart dead workers; their inbox lives in the front process, so queued updates are kept"""
+    while True:
+        await asyncio.sleep(1)
+        for i, p in enumerate(procs):
+            if not p.is_alive():
+                logging.error("worker %d exited with %s, restarting", i, p.exitcode)
+                procs[i] = spawn(i)
+
+def serve_sharded(make_app: Callable[[int], Application], workers: int, token: str, url: str, host: str, port: int,
+                  path: str = '/webhook', secret: Optional[str] = None, concurrency: int = 64, max_queued: int = 10000) -> None:
+    """Front process owns the webhook and routes each chat to worker chat_id % workers.
+    `make_app(index)` must be a module-level function: it runs inside each spawned worker."""
+    ctx = multiprocessing.get_context('spawn')
+    inboxes = [ctx.Queue(max_queued) for _ in range(workers)]
+
+    def spawn(i: int):
+        p = ctx.Process(target=_worker, args=(make_app, i, inboxes[i], concurrency, max_queued), name=f'worker{i}', daemon=True)
+        p.start()
+        return p
+
+    async def front() -> None:
+        procs = [spawn(i) for i in range(workers)]
+        async with Bot(token) as bot:
+            await bot.set_webhook(url=url.rstrip('/') + path, secret_token=secret,
+                                  allowed_updates=Update.ALL_TYPES, max_connections=min(100, concurrency * workers))
+        supervisor = asyncio.create_task(_supervise(procs, spawn))
+        logging.info("Webhook listening on %s:%s%s with %d workers", host, port, path, workers)
+        try:
+            await _server(ShardRouter(inboxes), host, port, path, secret).serve()
+        finally:
+            supervisor.cancel()
+            for q in inboxes:
+                q.put(None)
+            for p in procs:
+                p.join(timeout=30)
+
+    asyncio.run(front())